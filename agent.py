@@ -1,18 +1,33 @@
+import asyncio
+import time
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.tools import Tool
 from langchain_community.chat_models import ChatOllama
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from ml.title_index import get_title_resolver
+from llm.response_cache import ResponseCache, normalize_prompt
+from ml import metrics
 
 
-def create_agent(df, similarity_matrix, rules, hybrid_recommend):
+def create_agent(df, similarity_matrix, rules, hybrid_recommend, llm=None, model="llama3.2", cache=None):
     """
     Creates a movie recommendation agent using Ollama
+    
+    Pass llm to use another chat model (e.g. a fake one in tests), and cache
+    to share a ResponseCache; by default an in-memory cache is created.
     """
     
+    resolver = get_title_resolver(df)
+    
+    # How many requests skipped the LLM vs. went through it
+    stats = {"fast_path": 0, "llm_path": 0}
+    
     def recommend_tool(movie_name: str) -> str:
         """Recommends movies based on the input movie name"""
         try:
-            movies = hybrid_recommend(movie_name, df, similarity_matrix, rules)
+            with metrics.timer("agent_stage_seconds", stage="recommend"):
+                movies = hybrid_recommend(movie_name, df, similarity_matrix, rules)
 
             if movies[0] == "Movie not found in dataset":
                 return f"Sorry, '{movie_name}' was not found in the dataset."
@@ -27,10 +42,15 @@ def create_agent(df, similarity_matrix, rules, hybrid_recommend):
             return f"Error: {str(e)}"
 
     # Initialize Ollama LLM
-    llm = ChatOllama(
-        model="llama3.2",
-        temperature=0
-    )
+    if llm is None:
+        llm = ChatOllama(
+            model=model,
+            temperature=0
+        )
+    
+    # Chains run at temperature 0, so identical inputs give identical outputs
+    if cache is None:
+        cache = ResponseCache()
     
     # Create output parser
     output_parser = StrOutputParser()
@@ -46,6 +66,64 @@ Always be friendly and helpful."""),
     # Create the chain
     chain = prompt | llm | output_parser
     
+    # Extraction and formatting chains, built once per agent
+    extraction_prompt = ChatPromptTemplate.from_messages([
+        ("system", "Extract the movie name from the user's message. Return ONLY the movie name, nothing else. If no movie is mentioned, return 'NONE'."),
+        ("human", "{input}")
+    ])
+    
+    extraction_chain = (extraction_prompt | llm | output_parser).with_config(callbacks=[_LLMMetrics("extract", model)])
+    
+    format_prompt = ChatPromptTemplate.from_messages([
+        ("system", "You are a friendly movie recommendation assistant. Present these recommendations in a natural, conversational way."),
+        ("human", "User asked about: {movie_name}\n\nRecommendations:\n{recommendations}\n\nPresent this naturally.")
+    ])
+    
+    format_chain = (format_prompt | llm | output_parser).with_config(callbacks=[_LLMMetrics("format", model)])
+    
+    # Cache keys name the prompt, so agents sharing a cache never get each other's outputs
+    extraction_id = _prompt_id(extraction_prompt)
+    format_id = _prompt_id(format_prompt)
+    
+    def extraction_key(user_input):
+        return ResponseCache.make_key("extract", model, extraction_id, normalize_prompt(user_input))
+    
+    def format_key(movie_name, recommendations):
+        return ResponseCache.make_key("format", model, format_id, movie_name, recommendations)
+    
+    def extract_movie(user_input: str):
+        """
+        Find the movie the user is asking about
+        
+        Returns:
+            (movie_name, used_llm); movie_name is None if no movie was mentioned
+        """
+        
+        # Step 0: Skip the LLM when the message already names a catalog title
+        with metrics.timer("agent_stage_seconds", stage="resolve"):
+            movie_name = resolver.find_in_text(user_input)
+        
+        if movie_name is not None:
+            stats["fast_path"] += 1
+            metrics.inc("agent_requests_total", path="fast")
+            return movie_name, False
+        
+        stats["llm_path"] += 1
+        metrics.inc("agent_requests_total", path="llm")
+        
+        # Step 1: Extract movie name using LLM
+        with metrics.timer("agent_stage_seconds", stage="extract"):
+            movie_name = cache.get_or_compute(
+                extraction_key(user_input),
+                lambda: extraction_chain.invoke({"input": user_input})
+            ).strip().strip('"').strip("'")
+        
+        if movie_name == "NONE" or not movie_name:
+            return None, True
+        
+        # Map free text like "the dark knight" or "Inception (2010)" to a catalog title
+        return resolver.best_match(movie_name) or movie_name, True
+    
     def agent(user_input: str) -> str:
         """
         Process user input and return movie recommendations
@@ -57,46 +135,95 @@ Always be friendly and helpful."""),
             Formatted recommendation response
         """
         
-        # Step 1: Extract movie name using LLM
-        extraction_prompt = ChatPromptTemplate.from_messages([
-            ("system", "Extract the movie name from the user's message. Return ONLY the movie name, nothing else. If no movie is mentioned, return 'NONE'."),
-            ("human", "{input}")
-        ])
-        
-        extraction_chain = extraction_prompt | llm | output_parser
-        movie_name = extraction_chain.invoke({"input": user_input}).strip().strip('"').strip("'")
+        movie_name, used_llm = extract_movie(user_input)
         
-        if movie_name == "NONE" or not movie_name:
+        if movie_name is None:
             return "Please tell me which movie you'd like recommendations for!"
         
         # Step 2: Get recommendations
         recommendations = recommend_tool(movie_name)
         
+        if not used_llm:
+            return recommendations
+        
         # Step 3: Format with LLM for natural response
-        format_prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are a friendly movie recommendation assistant. Present these recommendations in a natural, conversational way."),
-            ("human", "User asked about: {movie_name}\n\nRecommendations:\n{recommendations}\n\nPresent this naturally.")
-        ])
+        with metrics.timer("agent_stage_seconds", stage="format"):
+            final_response = cache.get_or_compute(
+                format_key(movie_name, recommendations),
+                lambda: format_chain.invoke({
+                    "movie_name": movie_name,
+                    "recommendations": recommendations
+                })
+            )
         
-        format_chain = format_prompt | llm | output_parser
+        return final_response
+    
+    def stream(user_input: str):
+        """
+        Like agent(), but yields the plain recommendations as soon as they
+        are ready and then the LLM's formatted reply chunk by chunk
+        """
         
-        final_response = format_chain.invoke({
-            "movie_name": movie_name,
-            "recommendations": recommendations
-        })
+        movie_name, used_llm = extract_movie(user_input)
         
-        return final_response
+        if movie_name is None:
+            yield "Please tell me which movie you'd like recommendations for!"
+            return
+        
+        recommendations = recommend_tool(movie_name)
+        yield recommendations
+        
+        if not used_llm:
+            return
+        
+        yield "\n"
+        
+        key = format_key(movie_name, recommendations)
+        cached = cache.get(key)
+        
+        if cached is not None:
+            yield cached
+            return
+        
+        chunks = []
+        with metrics.timer("agent_stage_seconds", stage="format"):
+            for chunk in format_chain.stream({
+                "movie_name": movie_name,
+                "recommendations": recommendations
+            }):
+                chunks.append(chunk)
+                yield chunk
+        
+        cache.set(key, "".join(chunks))
+    
+    agent.stream = stream
+    agent.stats = stats
+    agent.cache = cache
+    
+    # Building blocks reused by the async variant
+    agent.resolver = resolver
+    agent.recommend = recommend_tool
+    agent.extraction_chain = extraction_chain
+    agent.format_chain = format_chain
+    agent.extraction_key = extraction_key
+    agent.format_key = format_key
+    agent.no_movie_reply = "Please tell me which movie you'd like recommendations for!"
     
     return agent
 
 
 # Simpler version without extra formatting
-def create_simple_agent(df, similarity_matrix, rules, hybrid_recommend):
+def create_simple_agent(df, similarity_matrix, rules, hybrid_recommend, llm=None, model="llama3.2", cache=None):
     """
     Creates a simpler movie recommendation agent
     """
     
-    llm = ChatOllama(model="llama3.2", temperature=0)
+    resolver = get_title_resolver(df)
+    
+    if llm is None:
+        llm = ChatOllama(model=model, temperature=0)
+    if cache is None:
+        cache = ResponseCache()
     output_parser = StrOutputParser()
     
     # Extraction chain
@@ -105,18 +232,20 @@ def create_simple_agent(df, similarity_matrix, rules, hybrid_recommend):
         ("human", "{input}")
     ])
     
-    extraction_chain = extraction_prompt | llm | output_parser
+    extraction_chain = (extraction_prompt | llm | output_parser).with_config(callbacks=[_LLMMetrics("extract", model)])
+    extraction_id = _prompt_id(extraction_prompt)
     
-    def agent(user_input: str) -> str:
-        # Extract movie name
-        movie_name = extraction_chain.invoke({"input": user_input}).strip().strip('"').strip("'")
-        
-        if movie_name == "NONE" or not movie_name:
-            return "Please specify a movie name to get recommendations!"
-        
+    def extraction_key(user_input):
+        return ResponseCache.make_key("extract", model, extraction_id, normalize_prompt(user_input))
+    
+    # How many requests skipped the LLM vs. went through it
+    stats = {"fast_path": 0, "llm_path": 0}
+    
+    def recommend(movie_name: str) -> str:
         # Get recommendations
         try:
-            movies = hybrid_recommend(movie_name, df, similarity_matrix, rules)
+            with metrics.timer("agent_stage_seconds", stage="recommend"):
+                movies = hybrid_recommend(movie_name, df, similarity_matrix, rules)
             
             if movies and movies[0] == "Movie not found in dataset":
                 return f"Sorry, I couldn't find '{movie_name}' in the database."
@@ -130,4 +259,327 @@ def create_simple_agent(df, similarity_matrix, rules, hybrid_recommend):
         except Exception as e:
             return f"An error occurred: {str(e)}"
     
-    return agent
\ No newline at end of file
+    def agent(user_input: str) -> str:
+        # Skip the LLM when the message already names a catalog title
+        with metrics.timer("agent_stage_seconds", stage="resolve"):
+            movie_name = resolver.find_in_text(user_input)
+        
+        if movie_name is not None:
+            stats["fast_path"] += 1
+            metrics.inc("agent_requests_total", path="fast")
+            return recommend(movie_name)
+        
+        stats["llm_path"] += 1
+        metrics.inc("agent_requests_total", path="llm")
+        
+        # Extract movie name
+        with metrics.timer("agent_stage_seconds", stage="extract"):
+            movie_name = cache.get_or_compute(
+                extraction_key(user_input),
+                lambda: extraction_chain.invoke({"input": user_input})
+            ).strip().strip('"').strip("'")
+        
+        if movie_name == "NONE" or not movie_name:
+            return "Please specify a movie name to get recommendations!"
+        
+        # Map free text to a catalog title
+        movie_name = resolver.best_match(movie_name) or movie_name
+        
+        return recommend(movie_name)
+    
+    def stream(user_input: str):
+        # No formatting step, so the whole reply is a single chunk
+        yield agent(user_input)
+    
+    agent.stream = stream
+    agent.stats = stats
+    agent.cache = cache
+    
+    # Building blocks reused by the async variant
+    agent.resolver = resolver
+    agent.recommend = recommend
+    agent.extraction_chain = extraction_chain
+    agent.format_chain = None
+    agent.extraction_key = extraction_key
+    agent.format_key = None
+    agent.no_movie_reply = "Please specify a movie name to get recommendations!"
+    
+    return agent
+
+
+def create_async_agent(df, similarity_matrix, rules, hybrid_recommend, llm=None, model="llama3.2", cache=None,
+                       max_concurrency=4, timeout=30.0):
+    """
+    Async variant of create_agent
+    
+    At most max_concurrency model calls run at once across all requests
+    served by this agent. A request that cannot finish its LLM steps within
+    timeout seconds gets a degraded reply built without the LLM.
+    """
+    sync_agent = create_agent(df, similarity_matrix, rules, hybrid_recommend, llm=llm, model=model, cache=cache)
+    return _make_async_agent(sync_agent, max_concurrency, timeout)
+
+
+def create_async_simple_agent(df, similarity_matrix, rules, hybrid_recommend, llm=None, model="llama3.2", cache=None,
+                              max_concurrency=4, timeout=30.0):
+    """
+    Async variant of create_simple_agent
+    """
+    sync_agent = create_simple_agent(df, similarity_matrix, rules, hybrid_recommend, llm=llm, model=model, cache=cache)
+    return _make_async_agent(sync_agent, max_concurrency, timeout)
+
+
+def _make_async_agent(sync_agent, max_concurrency, timeout):
+    resolver = sync_agent.resolver
+    recommend = sync_agent.recommend
+    extraction_chain = sync_agent.extraction_chain
+    format_chain = sync_agent.format_chain
+    cache = sync_agent.cache
+    stats = sync_agent.stats
+    stats.setdefault("degraded", 0)
+    
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    # The cache (SQLite when shared) and the recommender block, so they run
+    # on worker threads rather than stall every request on the event loop
+    async def cache_get(key):
+        return await asyncio.to_thread(cache.get, key)
+    
+    async def cache_set(key, value):
+        await asyncio.to_thread(cache.set, key, value)
+    
+    async def recommend_async(movie_name):
+        return await asyncio.to_thread(recommend, movie_name)
+    
+    async def call_llm(chain, inputs):
+        async with semaphore:
+            return await chain.ainvoke(inputs)
+    
+    async def extract_movie(user_input):
+        key = sync_agent.extraction_key(user_input)
+        movie_name = await cache_get(key)
+        
+        if movie_name is None:
+            with metrics.timer("agent_stage_seconds", stage="extract"):
+                movie_name = await call_llm(extraction_chain, {"input": user_input})
+            await cache_set(key, movie_name)
+        
+        movie_name = movie_name.strip().strip('"').strip("'")
+        
+        if movie_name == "NONE" or not movie_name:
+            return None
+        
+        return resolver.best_match(movie_name) or movie_name
+    
+    async def format_reply(movie_name, recommendations):
+        key = sync_agent.format_key(movie_name, recommendations)
+        reply = await cache_get(key)
+        
+        if reply is None:
+            with metrics.timer("agent_stage_seconds", stage="format"):
+                reply = await call_llm(format_chain, {
+                    "movie_name": movie_name,
+                    "recommendations": recommendations
+                })
+            await cache_set(key, reply)
+        
+        return reply
+    
+    async def llm_reply(user_input):
+        movie_name = await extract_movie(user_input)
+        
+        if movie_name is None:
+            return sync_agent.no_movie_reply
+        
+        recommendations = await recommend_async(movie_name)
+        
+        if format_chain is None:
+            return recommendations
+        
+        return await format_reply(movie_name, recommendations)
+    
+    async def degraded_reply(user_input):
+        """
+        Best effort answer without the LLM: fuzzy-match the whole message
+        """
+        stats["degraded"] += 1
+        metrics.inc("agent_requests_total", path="degraded")
+        movie_name = resolver.best_match(user_input, min_score=0.5)
+        
+        if movie_name is None:
+            return "Our AI concierge is busy right now. Try typing just the movie title!"
+        
+        return await recommend_async(movie_name)
+    
+    async def agent(user_input: str) -> str:
+        # Skip the LLM when the message already names a catalog title
+        with metrics.timer("agent_stage_seconds", stage="resolve"):
+            movie_name = resolver.find_in_text(user_input)
+        
+        if movie_name is not None:
+            stats["fast_path"] += 1
+            metrics.inc("agent_requests_total", path="fast")
+            return await recommend_async(movie_name)
+        
+        stats["llm_path"] += 1
+        metrics.inc("agent_requests_total", path="llm")
+        
+        try:
+            return await asyncio.wait_for(llm_reply(user_input), timeout)
+        except asyncio.TimeoutError:
+            return await degraded_reply(user_input)
+    
+    async def stream(user_input: str):
+        """
+        Async counterpart of agent.stream(); stops early, keeping what was
+        already sent, if the formatted reply runs past the timeout
+        """
+        deadline = asyncio.get_running_loop().time() + timeout
+        
+        with metrics.timer("agent_stage_seconds", stage="resolve"):
+            movie_name = resolver.find_in_text(user_input)
+        
+        if movie_name is not None:
+            stats["fast_path"] += 1
+            metrics.inc("agent_requests_total", path="fast")
+            yield await recommend_async(movie_name)
+            return
+        
+        stats["llm_path"] += 1
+        metrics.inc("agent_requests_total", path="llm")
+        
+        try:
+            movie_name = await asyncio.wait_for(extract_movie(user_input), timeout)
+        except asyncio.TimeoutError:
+            yield await degraded_reply(user_input)
+            return
+        
+        if movie_name is None:
+            yield sync_agent.no_movie_reply
+            return
+        
+        recommendations = await recommend_async(movie_name)
+        yield recommendations
+        
+        if format_chain is None:
+            return
+        
+        yield "\n"
+        
+        key = sync_agent.format_key(movie_name, recommendations)
+        cached = await cache_get(key)
+        
+        if cached is not None:
+            yield cached
+            return
+        
+        # The LLM slot is held only while the model generates: chunks are
+        # buffered, so a slow reader never keeps other requests waiting
+        chunks = []
+        buffered = asyncio.Queue()
+        done = object()
+        
+        async def generate():
+            async with semaphore:
+                try:
+                    async for chunk in format_chain.astream({
+                        "movie_name": movie_name,
+                        "recommendations": recommendations
+                    }):
+                        buffered.put_nowait(chunk)
+                finally:
+                    buffered.put_nowait(done)
+        
+        producer = asyncio.create_task(generate())
+        try:
+            while True:
+                remaining = deadline - asyncio.get_running_loop().time()
+                try:
+                    chunk = await asyncio.wait_for(buffered.get(), max(remaining, 0))
+                except asyncio.TimeoutError:
+                    stats["degraded"] += 1
+                    metrics.inc("agent_requests_total", path="degraded")
+                    return
+                
+                if chunk is done:
+                    break
+                
+                chunks.append(chunk)
+                yield chunk
+            
+            # Surfaces a failed model call
+            await producer
+        finally:
+            producer.cancel()
+        
+        await cache_set(key, "".join(chunks))
+    
+    agent.stream = stream
+    agent.stats = stats
+    agent.cache = cache
+    
+    return agent
+
+
+def _prompt_id(prompt):
+    """
+    Short hash of a prompt template's messages
+    """
+    return ResponseCache.make_key(prompt.pretty_repr())[:16]
+
+
+class _LLMMetrics(BaseCallbackHandler):
+    """
+    LangChain callback recording per-call LLM latency, token counts and errors
+
+    Token counts come from the message usage metadata when the model
+    reports it, or from Ollama's prompt_eval_count / eval_count.
+    """
+
+    def __init__(self, chain, model):
+        self.registry = metrics.REGISTRY
+        self.labels = {"chain": chain, "model": model}
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        if self.registry.enabled:
+            self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        if self.registry.enabled:
+            self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._started.pop(run_id, None)
+        if not self.registry.enabled:
+            return
+
+        if start is not None:
+            self.registry.observe("llm_request_seconds", time.perf_counter() - start, **self.labels)
+        self.registry.inc("llm_requests_total", **self.labels, result="ok")
+
+        prompt_tokens, completion_tokens = _token_usage(response)
+        self.registry.inc("llm_tokens_total", prompt_tokens, **self.labels, kind="prompt")
+        self.registry.inc("llm_tokens_total", completion_tokens, **self.labels, kind="completion")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+        self.registry.inc("llm_requests_total", **self.labels, result="error")
+
+
+def _token_usage(response):
+    prompt_tokens = completion_tokens = 0
+
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            info = generation.generation_info or {}
+
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+            else:
+                prompt_tokens += info.get("prompt_eval_count") or 0
+                completion_tokens += info.get("eval_count") or 0
+
+    return prompt_tokens, completion_tokens
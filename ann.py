@@ -0,0 +1,254 @@
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+from sklearn.preprocessing import normalize
+
+from ml.similarity import NeighborIndex, build_tfidf_matrix, top_neighbors
+
+
+class IVFIndex:
+    """
+    Inverted-file index for approximate cosine top-K search
+
+    A spherical k-means coarse quantizer splits the movies into n_lists
+    lists; a query is scored only against the movies in its n_probe
+    closest lists. n_probe is the recall/latency knob: n_probe = n_lists
+    is an exact scan.
+
+    Works on L2-normalized rows, sparse (TF-IDF) or dense (embeddings).
+    Vectors are stored in list order, so each list is one contiguous slice.
+    """
+
+    def __init__(self, vectors, centroids, list_indptr, list_rows, n_probe=8):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_indptr = list_indptr
+        self.list_rows = list_rows
+        self.n_probe = n_probe
+        # Batches at least this large visit each probed list once for all
+        # their queries; smaller ones are scored query by query
+        self.group_threshold = 32
+        self._centroids_t = centroids.T.tocsr() if issparse(centroids) else np.ascontiguousarray(centroids.T)
+
+    def __len__(self):
+        return len(self.list_rows)
+
+    @property
+    def n_lists(self):
+        return len(self.list_indptr) - 1
+
+    def search(self, queries, k, n_probe=None, exclude=None):
+        """
+        Approximate top-k rows for each query row, by descending cosine
+
+        exclude optionally gives one row per query to leave out (the query
+        movie itself). Slots beyond the movies found hold -1 / -inf.
+        """
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        n_queries = queries.shape[0]
+        exclude = None if exclude is None else np.asarray(exclude)
+
+        ids = np.full((n_queries, k), -1, dtype=np.int64)
+        scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+
+        coarse = _dense(queries @ self._centroids_t)
+        probes = np.argpartition(-coarse, n_probe - 1, axis=1)[:, :n_probe]
+
+        if n_queries < self.group_threshold:
+            for i in range(n_queries):
+                ids[i], scores[i] = self._search_one(
+                    queries[i:i + 1], probes[i], k, None if exclude is None else exclude[i]
+                )
+        else:
+            self._search_grouped(queries, probes, k, exclude, ids, scores)
+
+        ids[scores == -np.inf] = -1
+        return ids, scores
+
+    def _search_grouped(self, queries, probes, k, exclude, ids, scores):
+        """
+        Visit each probed list once, scoring all the queries that probe it
+        together, and merge into ids/scores in place
+        """
+        query_of = np.repeat(np.arange(queries.shape[0]), probes.shape[1])
+        list_of = probes.ravel()
+        order = np.argsort(list_of, kind="stable")
+        query_of, list_of = query_of[order], list_of[order]
+
+        for group in np.split(np.arange(len(list_of)), np.flatnonzero(np.diff(list_of)) + 1):
+            start, end = self.list_indptr[list_of[group[0]]], self.list_indptr[list_of[group[0]] + 1]
+            if start == end:
+                continue
+
+            queries_in = query_of[group]
+            members = np.broadcast_to(self.list_rows[start:end], (len(group), end - start))
+            block = _dense(queries[queries_in] @ self.vectors[start:end].T).astype(np.float32)
+
+            if exclude is not None:
+                block[members == exclude[queries_in, None]] = -np.inf
+
+            ids[queries_in], scores[queries_in] = _merge_top(
+                ids[queries_in], scores[queries_in], members, block, k
+            )
+
+    def _search_one(self, query, probes, k, exclude):
+        """
+        Score one query against the concatenated rows of its probed lists
+        """
+        starts = self.list_indptr[probes]
+        positions = _ranges(starts, self.list_indptr[probes + 1] - starts)
+
+        members = self.list_rows[positions]
+        block = _dense(self.vectors[positions] @ query.T).ravel().astype(np.float32)
+
+        if exclude is not None:
+            block[members == exclude] = -np.inf
+
+        ids, scores = _merge_top(
+            np.full((1, 0), -1, dtype=np.int64), np.zeros((1, 0), dtype=np.float32), members[None], block[None], k
+        )
+        pad = k - ids.shape[1]
+        return np.pad(ids[0], (0, pad), constant_values=-1), np.pad(scores[0], (0, pad), constant_values=-np.inf)
+
+
+def build_ivf_index(vectors, n_lists=None, n_probe=8, n_iter=10, sample_size=None,
+                    centroid_nnz=256, block_size=4096, seed=0):
+    """
+    Train the coarse quantizer on a sample of vectors and file every row
+    into its closest list
+
+    n_lists defaults to about sqrt(N). Sparse centroids keep only
+    their centroid_nnz largest weights, so they stay as sparse as the
+    vectors they summarize.
+    """
+    vectors = csr_matrix(vectors, dtype=np.float32) if issparse(vectors) else np.asarray(vectors, dtype=np.float32)
+    n_rows = vectors.shape[0]
+
+    n_lists = n_lists or int(np.sqrt(n_rows))
+    n_lists = max(1, min(n_lists, n_rows))
+
+    rng = np.random.default_rng(seed)
+    sample_size = min(n_rows, sample_size or 32 * n_lists)
+    sample = vectors[np.sort(rng.choice(n_rows, sample_size, replace=False))]
+
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)]
+    for _ in range(n_iter):
+        assignments = _assign(sample, centroids, block_size)
+        centroids = _update_centroids(sample, assignments, n_lists, centroid_nnz, rng)
+
+    assignments = _assign(vectors, centroids, block_size)
+    list_rows = np.argsort(assignments, kind="stable")
+
+    list_indptr = np.zeros(n_lists + 1, dtype=np.int64)
+    list_indptr[1:] = np.cumsum(np.bincount(assignments, minlength=n_lists))
+
+    return IVFIndex(vectors[list_rows], centroids, list_indptr, list_rows, n_probe=n_probe)
+
+
+def build_ann_neighbor_index(df, top_k=50, n_lists=None, n_probe=8, block_size=4096, seed=0):
+    """
+    Approximate drop-in for similarity.build_neighbor_index
+
+    Each movie's neighbors come from its n_probe closest IVF lists instead
+    of the whole catalog. Movies whose probed lists hold fewer than top_k
+    other movies fall back to the exact scan.
+    """
+    tfidf_matrix = build_tfidf_matrix(df)
+    n_movies = tfidf_matrix.shape[0]
+    top_k = max(0, min(top_k, n_movies - 1))
+
+    neighbors = np.empty((n_movies, top_k), dtype=np.int32)
+    scores = np.empty((n_movies, top_k), dtype=np.float32)
+
+    if top_k == 0:
+        return NeighborIndex(neighbors, scores)
+
+    index = build_ivf_index(tfidf_matrix, n_lists=n_lists, n_probe=n_probe, block_size=block_size, seed=seed)
+
+    for start in range(0, n_movies, block_size):
+        rows = np.arange(start, min(start + block_size, n_movies))
+        block_neighbors, scores[rows] = index.search(tfidf_matrix[rows], top_k, exclude=rows)
+        neighbors[rows] = block_neighbors
+
+    short = np.flatnonzero((neighbors < 0).any(axis=1))
+    if len(short):
+        tfidf_t = tfidf_matrix.T.tocsr()
+        for start in range(0, len(short), block_size):
+            rows = short[start:start + block_size]
+            neighbors[rows], scores[rows] = top_neighbors(tfidf_matrix, tfidf_t, rows, top_k)
+
+    return NeighborIndex(neighbors, scores)
+
+
+def _dense(matrix):
+    return matrix.toarray() if issparse(matrix) else np.asarray(matrix)
+
+
+def _ranges(starts, lengths):
+    """
+    Concatenation of arange(start, start + length) for each pair
+    """
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+def _merge_top(ids, scores, new_ids, new_scores, k):
+    """
+    Best k of two (ids, scores) candidate sets per row, by descending score
+    """
+    ids = np.hstack([ids, new_ids])
+    scores = np.hstack([scores, new_scores])
+
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    return np.take_along_axis(np.take_along_axis(ids, top, axis=1), order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def _assign(vectors, centroids, block_size):
+    """
+    Closest centroid (highest cosine) per row
+    """
+    centroids_t = centroids.T.tocsr() if issparse(centroids) else centroids.T
+    assignments = np.empty(vectors.shape[0], dtype=np.int64)
+
+    for start in range(0, vectors.shape[0], block_size):
+        end = min(start + block_size, vectors.shape[0])
+        assignments[start:end] = _dense(vectors[start:end] @ centroids_t).argmax(axis=1)
+
+    return assignments
+
+
+def _update_centroids(sample, assignments, n_lists, centroid_nnz, rng):
+    """
+    Spherical k-means step: normalized sum of each list's members, with
+    empty lists reseeded from random sample rows
+    """
+    sizes = np.bincount(assignments, minlength=n_lists)
+    empty = np.flatnonzero(sizes == 0)
+
+    lists = np.concatenate([assignments, empty])
+    members = np.concatenate([np.arange(len(assignments)), rng.integers(sample.shape[0], size=len(empty))])
+    membership = csr_matrix(
+        (np.ones(len(lists), dtype=np.float32), (lists, members)),
+        shape=(n_lists, sample.shape[0])
+    )
+    sums = membership @ sample
+
+    if issparse(sums):
+        sums = _truncate_rows(sums.tocsr(), centroid_nnz)
+
+    return normalize(sums).astype(np.float32)
+
+
+def _truncate_rows(matrix, nnz):
+    """
+    Keep the nnz largest entries of each row of a CSR matrix
+    """
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    order = np.lexsort((-matrix.data, rows))
+    rank = np.arange(len(order)) - matrix.indptr[rows]
+    keep = order[rank < nnz]
+
+    return csr_matrix((matrix.data[keep], (rows[keep], matrix.indices[keep])), shape=matrix.shape)
@@ -1,12 +1,14 @@
 import streamlit as st
 import pandas as pd
-from ml.preprocessing import load_and_clean_data
-from ml.similarity import build_similarity_matrix
-from ml.association import build_association_rules
+from ml.artifacts import load_or_build_artifacts, get_artifact_dir
 from ml.recommender import hybrid_recommend
-from llm.agent import create_simple_agent
+from ml.title_index import get_title_index, get_title_resolver
+from ml.catalog import get_catalog_index, get_catalog_summary
+from llm.agent import create_agent
+from llm.response_cache import ResponseCache
 import time
 import random
+import os
 
 
 # Page configuration
@@ -17,6 +19,9 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Movies per page in the Browse tab
+BROWSE_PAGE_SIZE = 20
+
 # Custom CSS for theater vibe
 st.markdown("""
     <style>
@@ -364,22 +369,23 @@ st.markdown("""
 @st.cache_resource(show_spinner=False)
 def initialize_system():
     """Initialize the recommendation system"""
-    df = load_and_clean_data()
-    similarity_matrix = build_similarity_matrix(df)
-    rules = build_association_rules(df)
-    agent = create_simple_agent(df, similarity_matrix, rules, hybrid_recommend)
+    df, similarity_matrix, rules = load_or_build_artifacts()
+    # On-disk cache so every Streamlit worker shares LLM responses
+    cache = ResponseCache(path=os.path.join(get_artifact_dir(), 'llm_cache.sqlite'))
+    agent = create_agent(df, similarity_matrix, rules, hybrid_recommend, cache=cache)
     return df, similarity_matrix, rules, agent
 
 
 def get_movie_details(df, movie_title):
     """Get detailed info about a movie"""
-    movie = df[df['title'] == movie_title]
-    if len(movie) > 0:
+    row = get_title_index(df).get(movie_title)
+    if row is not None:
+        movie = df.iloc[row]
         return {
-            'genres': ', '.join(movie.iloc[0]['genres'][:3]),
-            'cast': ', '.join(movie.iloc[0]['cast'][:3]),
-            'rating': movie.iloc[0]['vote_average'],
-            'popularity': movie.iloc[0]['popularity']
+            'genres': ', '.join(movie['genres'][:3]),
+            'cast': ', '.join(movie['cast'][:3]),
+            'rating': movie['vote_average'],
+            'popularity': movie['popularity']
         }
     return None
 
@@ -421,6 +427,7 @@ def main():
     try:
         with st.spinner('🎬 Rolling the film...'):
             df, similarity_matrix, rules, agent = initialize_system()
+        summary = get_catalog_summary(df)
         
         # Stats Dashboard - Popcorn style
         st.markdown('<div class="now-showing"><h2>📊 BOX OFFICE STATS</h2></div>', unsafe_allow_html=True)
@@ -431,37 +438,34 @@ def main():
             st.markdown(f"""
                 <div class="stats-container">
                     <div class="stats-icon">🎥</div>
-                    <div class="stats-number">{len(df):,}</div>
+                    <div class="stats-number">{summary.movies:,}</div>
                     <div class="stats-label">Total Movies</div>
                 </div>
             """, unsafe_allow_html=True)
         
         with col2:
-            unique_genres = df['genres'].explode().nunique()
             st.markdown(f"""
                 <div class="stats-container">
                     <div class="stats-icon">🎭</div>
-                    <div class="stats-number">{unique_genres}</div>
+                    <div class="stats-number">{summary.genres}</div>
                     <div class="stats-label">Genres</div>
                 </div>
             """, unsafe_allow_html=True)
         
         with col3:
-            unique_cast = df['cast'].explode().nunique()
             st.markdown(f"""
                 <div class="stats-container">
                     <div class="stats-icon">⭐</div>
-                    <div class="stats-number">{unique_cast:,}</div>
+                    <div class="stats-number">{summary.actors:,}</div>
                     <div class="stats-label">Actors</div>
                 </div>
             """, unsafe_allow_html=True)
         
         with col4:
-            avg_rating = df['vote_average'].mean()
             st.markdown(f"""
                 <div class="stats-container">
                     <div class="stats-icon">🍿</div>
-                    <div class="stats-number">{avg_rating:.1f}/10</div>
+                    <div class="stats-number">{summary.mean_rating:.1f}/10</div>
                     <div class="stats-label">Avg Rating</div>
                 </div>
             """, unsafe_allow_html=True)
@@ -489,12 +493,19 @@ def main():
                 search_button = st.button("🎬 GET TICKETS", key="ai_btn", use_container_width=True)
             
             if search_button and user_input:
+                st.markdown('<div class="marquee-container">', unsafe_allow_html=True)
+                reply = st.empty()
+                chunks = agent.stream(user_input)
+                
                 with st.spinner("🎬 AI is finding your perfect match..."):
-                    response = agent(user_input)
-                    time.sleep(0.5)  # Dramatic pause
+                    response = next(chunks, "")
+                reply.success(f"🎭 **AI Concierge Says:**\n\n{response}")
+                
+                # Render the formatted reply as it streams in
+                for chunk in chunks:
+                    response += chunk
+                    reply.success(f"🎭 **AI Concierge Says:**\n\n{response}")
                 
-                st.markdown('<div class="marquee-container">', unsafe_allow_html=True)
-                st.success(f"🎭 **AI Concierge Says:**\n\n{response}")
                 st.markdown('</div>', unsafe_allow_html=True)
         
         with tab2:
@@ -503,7 +514,15 @@ def main():
             col_search1, col_search2 = st.columns([3, 1])
             
             with col_search1:
-                movie_list = sorted(df['title'].tolist())
+                title_query = st.text_input(
+                    "Type a title (typos welcome):",
+                    placeholder="e.g., 'the dark knight' or 'Inception (2010)'",
+                    key="title_query"
+                )
+                if title_query:
+                    movie_list = get_title_resolver(df).complete(title_query, limit=20)
+                else:
+                    movie_list = summary.titles
                 selected_movie = st.selectbox(
                     "Pick a movie from our collection:",
                     options=[""] + movie_list,
@@ -530,11 +549,12 @@ def main():
         with tab3:
             st.markdown("### 🎬 Browse Our Movie Collection")
             
+            catalog = get_catalog_index(df)
+            
             col_filter1, col_filter2, col_filter3 = st.columns(3)
             
             with col_filter1:
-                all_genres = sorted(set([genre for genres in df['genres'] for genre in genres]))
-                selected_genre = st.selectbox("🎭 Filter by Genre:", ["All Genres"] + all_genres)
+                selected_genre = st.selectbox("🎭 Filter by Genre:", ["All Genres"] + catalog.genre_names())
             
             with col_filter2:
                 sort_by = st.selectbox("📊 Sort by:", ["Popularity", "Rating", "Title"])
@@ -542,24 +562,20 @@ def main():
             with col_filter3:
                 min_rating = st.slider("⭐ Minimum Rating:", 0.0, 10.0, 6.0, 0.5)
             
-            # Filter data
-            filtered_df = df[df['vote_average'] >= min_rating].copy()
+            genre = None if selected_genre == "All Genres" else selected_genre
+            total = catalog.count(genre, min_rating)
+            n_pages = max(1, -(-total // BROWSE_PAGE_SIZE))
             
-            if selected_genre != "All Genres":
-                filtered_df = filtered_df[filtered_df['genres'].apply(lambda x: selected_genre in x)]
+            st.markdown(f'<div class="now-showing"><h2>🎟️ NOW SHOWING: {total} MOVIES</h2></div>', unsafe_allow_html=True)
             
-            # Sort
-            if sort_by == "Popularity":
-                filtered_df = filtered_df.sort_values('popularity', ascending=False)
-            elif sort_by == "Rating":
-                filtered_df = filtered_df.sort_values('vote_average', ascending=False)
-            else:
-                filtered_df = filtered_df.sort_values('title')
-            
-            st.markdown(f'<div class="now-showing"><h2>🎟️ NOW SHOWING: {len(filtered_df)} MOVIES</h2></div>', unsafe_allow_html=True)
+            page = st.number_input(f"📄 Page (of {n_pages}):", min_value=1, max_value=n_pages, value=1, step=1)
+            _, rows = catalog.query(
+                genre, min_rating, sort_by.lower(),
+                offset=(page - 1) * BROWSE_PAGE_SIZE, limit=BROWSE_PAGE_SIZE
+            )
             
             # Display movies in expandable cards
-            for idx, row in filtered_df.head(20).iterrows():
+            for idx, row in df.iloc[rows].iterrows():
                 with st.expander(f"⭐ {row['title']} ({row['vote_average']}/10)"):
                     col_info1, col_info2 = st.columns(2)
                     
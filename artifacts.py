@@ -0,0 +1,290 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from ml.preprocessing import load_and_clean_data, get_data_paths, get_derived
+from ml.similarity import build_neighbor_index, build_embedding_index, NeighborIndex, EmbeddingIndex
+from ml.ann import build_ann_neighbor_index
+from ml.association import build_association_rules, build_rule_index, RuleIndex
+from ml.title_index import get_title_index, get_title_resolver, TitleResolver
+from ml.features import get_feature_store, FeatureStore
+from ml.catalog import get_catalog_index, get_catalog_summary, CatalogSummary
+from ml import metrics
+
+
+# Bump whenever the on-disk layout or the build pipeline changes, so stale
+# artifacts built by older code are never picked up
+ARTIFACT_VERSION = 12
+
+# Components of the LSA embeddings stored next to the neighbor index
+EMBEDDING_DIM = 128
+
+# Opt-in similarity backends a build only carries once asked for, and the
+# file that tells whether it has them
+OPTIONAL_INDEXES = {"embeddings": "embeddings.npy", "ann": "ann_neighbors.npy"}
+
+
+def get_artifact_dir():
+    """
+    Default artifact location: movie_recommender/artifacts
+    """
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    movie_recommender_dir = os.path.dirname(current_dir)
+    return os.path.join(movie_recommender_dir, 'artifacts')
+
+
+def compute_source_hash(data_dir=None):
+    """
+    Content hash of the source CSVs plus the artifact version
+    """
+    digest = hashlib.sha256(f"v{ARTIFACT_VERSION}".encode())
+
+    for path in get_data_paths(data_dir):
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def save_artifacts(artifact_dir, source_hash, df, similarity_index, rules, optional_index=None):
+    """
+    Write a model build to artifact_dir/<source_hash>
+
+    optional_index is an (arrays by file name, manifest entries) pair from
+    build_optional_index, for a build that carries an opt-in backend.
+
+    Files are written to a temporary directory first and renamed into place,
+    so a concurrently starting worker never sees a half-written build.
+    """
+    os.makedirs(artifact_dir, exist_ok=True)
+    target = os.path.join(artifact_dir, source_hash)
+
+    tmp_dir = tempfile.mkdtemp(prefix='.build-', dir=artifact_dir)
+    try:
+        df.to_pickle(os.path.join(tmp_dir, 'movies.pkl'))
+
+        features = get_feature_store(df)
+        for name in FeatureStore.ARRAYS:
+            np.save(os.path.join(tmp_dir, f'features_{name}.npy'), getattr(features, name))
+
+        for name in RuleIndex.ARRAYS:
+            np.save(os.path.join(tmp_dir, f'rules_{name}.npy'), getattr(rules, name))
+
+        resolver = get_title_resolver(df)
+        for name in TitleResolver.ARRAYS:
+            np.save(os.path.join(tmp_dir, f'resolver_{name}.npy'), getattr(resolver, name))
+
+        np.save(os.path.join(tmp_dir, 'neighbors.npy'), similarity_index.neighbors)
+        np.save(os.path.join(tmp_dir, 'scores.npy'), similarity_index.scores)
+
+        arrays, entries = optional_index or ({}, {})
+        for filename, array in arrays.items():
+            np.save(os.path.join(tmp_dir, filename), array)
+
+        with open(os.path.join(tmp_dir, 'summary.json'), 'w') as f:
+            json.dump(get_catalog_summary(df).to_dict(), f)
+
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+            json.dump({
+                'version': ARTIFACT_VERSION,
+                'source_hash': source_hash,
+                'movies': len(df),
+                'top_k': similarity_index.top_k,
+                'rules': len(rules),
+                'embedding_dim': None,
+                'ann_top_k': None,
+                **entries,
+            }, f, indent=2)
+
+        os.rename(tmp_dir, target)
+    except OSError:
+        # Another worker finished the same build first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.exists(os.path.join(target, 'manifest.json')):
+            raise
+
+    return target
+
+
+def load_artifacts(path, mmap=True, similarity="neighbors"):
+    """
+    Load a model build from disk
+
+    The .npy arrays are memory-mapped read-only by default, so every
+    worker process on the host shares the same page-cache copy; the
+    movies frame is unpickled, so each process holds its own. With
+    similarity="embeddings", the similarity index returned is the build's
+    EmbeddingIndex instead of the top-K NeighborIndex, which trades
+    accuracy for speed (its candidates are not the exact ones), and with
+    similarity="ann" it is the NeighborIndex found by the IVF search (see
+    ml.ann), which trades some recall for a build that never scans the
+    whole catalog per movie.
+    """
+    mmap_mode = 'r' if mmap else None
+
+    df = pd.read_pickle(os.path.join(path, 'movies.pkl'))
+    get_title_index(df)
+
+    resolver = TitleResolver(df["title"], **{
+        name: np.load(os.path.join(path, f'resolver_{name}.npy'), mmap_mode=mmap_mode)
+        for name in TitleResolver.ARRAYS
+    })
+    get_derived(df, "title_resolver", lambda _: resolver)
+
+    features = FeatureStore(**{
+        name: np.load(os.path.join(path, f'features_{name}.npy'), mmap_mode=mmap_mode)
+        for name in FeatureStore.ARRAYS
+    })
+    # Register the loaded store so get_feature_store(df) doesn't rebuild it
+    get_derived(df, "features", lambda _: features)
+    get_catalog_index(df)
+
+    with open(os.path.join(path, 'summary.json')) as f:
+        summary = CatalogSummary(**json.load(f))
+    get_derived(df, "catalog_summary", lambda _: summary)
+    rules = RuleIndex(**{
+        name: np.load(os.path.join(path, f'rules_{name}.npy'), mmap_mode=mmap_mode)
+        for name in RuleIndex.ARRAYS
+    })
+
+    if similarity == "embeddings":
+        similarity_index = EmbeddingIndex(np.load(os.path.join(path, 'embeddings.npy'), mmap_mode=mmap_mode))
+    elif similarity == "neighbors":
+        similarity_index = NeighborIndex(
+            np.load(os.path.join(path, 'neighbors.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, 'scores.npy'), mmap_mode=mmap_mode)
+        )
+    elif similarity == "ann":
+        similarity_index = NeighborIndex(
+            np.load(os.path.join(path, 'ann_neighbors.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, 'ann_scores.npy'), mmap_mode=mmap_mode)
+        )
+    else:
+        raise ValueError(f"Unknown similarity index: {similarity}")
+
+    return df, similarity_index, rules
+
+
+def build_artifacts(artifact_dir=None, data_dir=None, n_jobs=1, similarity="neighbors"):
+    """
+    Run the full pipeline and persist it to the artifact directory
+
+    n_jobs worker processes build the neighbor index and mine the rules
+    (-1 for every core). The opt-in backends in OPTIONAL_INDEXES are only
+    built when similarity names one.
+    """
+    artifact_dir = artifact_dir or get_artifact_dir()
+    source_hash = compute_source_hash(data_dir)
+
+    with metrics.timer("build_stage_seconds", stage="load"):
+        df = load_and_clean_data(data_dir)
+    with metrics.timer("build_stage_seconds", stage="neighbors"):
+        similarity_index = build_neighbor_index(df, n_jobs=n_jobs)
+    with metrics.timer("build_stage_seconds", stage="rules"):
+        rules = build_rule_index(build_association_rules(df, n_jobs=n_jobs), df)
+    optional_index = build_optional_index(df, similarity) if similarity in OPTIONAL_INDEXES else None
+
+    with metrics.timer("build_stage_seconds", stage="save"):
+        return save_artifacts(artifact_dir, source_hash, df, similarity_index, rules, optional_index)
+
+
+def ensure_artifacts(artifact_dir=None, data_dir=None, n_jobs=1, similarity="neighbors"):
+    """
+    Path of the build matching the current source CSVs, building it first
+    if the inputs changed since the last build
+
+    When similarity names an opt-in backend that a matching build was made
+    without, it is added to that build. After a new build, the builds for
+    older source hashes are removed (see prune_artifacts).
+    """
+    artifact_dir = artifact_dir or get_artifact_dir()
+    path = os.path.join(artifact_dir, compute_source_hash(data_dir))
+
+    if not os.path.exists(os.path.join(path, 'manifest.json')):
+        print(f"No artifacts for current data, building into: {artifact_dir}")
+        path = build_artifacts(artifact_dir, data_dir, n_jobs=n_jobs, similarity=similarity)
+        prune_artifacts(artifact_dir, keep=os.path.basename(path))
+    elif similarity in OPTIONAL_INDEXES and not os.path.exists(os.path.join(path, OPTIONAL_INDEXES[similarity])):
+        add_optional_index(path, similarity)
+
+    return path
+
+
+def prune_artifacts(artifact_dir, keep):
+    """
+    Remove every build in artifact_dir except the one named keep
+
+    Only <source_hash> build directories are touched; the LLM cache and
+    builds still being written (.build-*) stay. Workers still mapping a
+    removed build keep reading it until they restart.
+    """
+    for name in os.listdir(artifact_dir):
+        path = os.path.join(artifact_dir, name)
+        if name != keep and re.fullmatch(r'[0-9a-f]{64}', name) and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def build_optional_index(df, similarity):
+    """
+    Arrays of an opt-in similarity backend by file name, and the manifest
+    entries describing them
+    """
+    with metrics.timer("build_stage_seconds", stage=similarity):
+        if similarity == "embeddings":
+            embedding_index = build_embedding_index(df, dim=EMBEDDING_DIM)
+            return {'embeddings.npy': embedding_index.embeddings}, {'embedding_dim': embedding_index.dim}
+
+        ann_index = build_ann_neighbor_index(df)
+        return {'ann_scores.npy': ann_index.scores, 'ann_neighbors.npy': ann_index.neighbors}, {'ann_top_k': ann_index.top_k}
+
+
+def add_optional_index(path, similarity):
+    """
+    Build an opt-in similarity backend for an existing build and store it with it
+    """
+    df, _, _ = load_artifacts(path)
+    arrays, entries = build_optional_index(df, similarity)
+
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+    manifest.update(entries)
+
+    # Renamed into place, so a worker never reads a half-written file; the
+    # file ensure_artifacts checks for goes last
+    for filename, array in arrays.items():
+        _replace_file(os.path.join(path, filename), lambda f: np.save(f, array))
+    _replace_file(os.path.join(path, 'manifest.json'), lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+
+
+def _replace_file(target, write):
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(target))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_or_build_artifacts(artifact_dir=None, data_dir=None, similarity="neighbors"):
+    """
+    Load the build matching the current source CSVs, rebuilding only if
+    the inputs changed since the last build
+    """
+    path = ensure_artifacts(artifact_dir, data_dir, similarity=similarity)
+
+    print(f"Loading artifacts from: {path}")
+    with metrics.timer("artifact_load_seconds"):
+        return load_artifacts(path, similarity=similarity)
+
+
+if __name__ == "__main__":
+    print(f"Artifacts written to: {build_artifacts(n_jobs=-1)}")
@@ -1,25 +1,240 @@
-from mlxtend.preprocessing import TransactionEncoder
-from mlxtend.frequent_patterns import apriori, association_rules
-import pandas as pd
+from scipy.sparse import csr_matrix
+import numpy as np
+from ml.features import get_feature_store
+from ml.rule_mining import mine_frequent_itemsets, generate_rules
 
 
-def build_association_rules(df):
-    transactions = df["combined"].str.split().tolist()
+def build_association_rules(df, min_support=0.02, min_confidence=0.3, max_len=None, max_rules=None, n_jobs=1):
+    """
+    Mine genre/cast association rules from the feature store
 
-    te = TransactionEncoder()
-    te_array = te.fit(transactions).transform(transactions)
-    df_encoded = pd.DataFrame(te_array, columns=te.columns_)
+    Transactions are the movies' entity id lists, used as-is (no dense
+    movies x items matrix). max_len caps itemset size, max_rules keeps only
+    the most confident rules and n_jobs > 1 counts itemsets in parallel.
+    """
+    features = get_feature_store(df)
 
-    frequent_itemsets = apriori(
-        df_encoded,
-        min_support=0.02,
-        use_colnames=True
+    frequent_itemsets = mine_frequent_itemsets(
+        features.indptr,
+        features.indices,
+        features.n_entities,
+        min_support=min_support,
+        max_len=max_len,
+        n_jobs=n_jobs
     )
 
-    rules = association_rules(
+    rules = generate_rules(
         frequent_itemsets,
-        metric="confidence",
-        min_threshold=0.3
+        len(features),
+        features.labels,
+        min_confidence=min_confidence,
+        max_rules=max_rules
     )
 
-    return rules
\ No newline at end of file
+    return rules
+
+
+class RuleIndex:
+    """
+    Association rules compiled into integer arrays keyed by antecedent token
+
+    Rule ids follow the row order of the rules frame. For each token id,
+    token_rules[token_indptr[t]:token_indptr[t + 1]] lists the rules that
+    have t in their antecedent; consequent_tokens is laid out the same way
+    per rule. movie_tokens holds every movie's rule tokens as a CSR matrix.
+    """
+
+    ARRAYS = (
+        "tokens",
+        "token_indptr",
+        "token_rules",
+        "antecedent_sizes",
+        "consequent_indptr",
+        "consequent_tokens",
+        "confidence",
+        "movie_indptr",
+        "movie_token_ids",
+    )
+
+    def __init__(self, tokens, token_indptr, token_rules, antecedent_sizes,
+                 consequent_indptr, consequent_tokens, confidence,
+                 movie_indptr, movie_token_ids):
+        self.tokens = tokens
+        self.token_indptr = token_indptr
+        self.token_rules = token_rules
+        self.antecedent_sizes = antecedent_sizes
+        self.consequent_indptr = consequent_indptr
+        self.consequent_tokens = consequent_tokens
+        self.confidence = confidence
+        self.movie_indptr = movie_indptr
+        self.movie_token_ids = movie_token_ids
+        self._antecedents = None
+
+    def __len__(self):
+        return len(self.confidence)
+
+    def boost_matrix(self, rows):
+        """
+        Boost per token for each movie in rows, equivalent to the old
+        boost_dict: every rule whose antecedent is contained in the movie's
+        tokens sets its confidence on each consequent, later rules
+        overwriting earlier ones
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        n_tokens = len(self.tokens)
+
+        lengths = self.movie_indptr[rows + 1] - self.movie_indptr[rows]
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        query_tokens = csr_matrix(
+            (np.ones(indptr[-1], dtype=np.int32), _gather(self.movie_indptr, self.movie_token_ids, rows), indptr),
+            shape=(len(rows), n_tokens)
+        )
+
+        # A rule fires when all of its antecedent tokens were hit
+        hits = (query_tokens @ self._antecedent_matrix()).tocoo()
+        fired = hits.data == self.antecedent_sizes[hits.col]
+        queries, fired_rules = hits.row[fired], hits.col[fired]
+
+        lengths = np.diff(self.consequent_indptr)[fired_rules]
+        consequents = _gather(self.consequent_indptr, self.consequent_tokens, fired_rules)
+
+        # Last fired rule wins for each (query, consequent token)
+        winner = np.full(len(rows) * n_tokens, -1, dtype=np.int64)
+        np.maximum.at(
+            winner,
+            np.repeat(queries.astype(np.int64), lengths) * n_tokens + consequents,
+            np.repeat(fired_rules.astype(np.int64), lengths)
+        )
+
+        boosts = np.zeros(len(rows) * n_tokens, dtype=np.float64)
+        boosted = winner >= 0
+        boosts[boosted] = self.confidence[winner[boosted]]
+
+        return boosts.reshape(len(rows), n_tokens)
+
+    def boost_vector(self, idx):
+        return self.boost_matrix([idx])[0]
+
+    def candidate_boosts(self, boosts, candidates):
+        """
+        Boost for each candidate movie: the strongest boost among its tokens
+
+        boosts is a (n_queries, n_tokens) boost matrix and candidates a
+        (n_queries, n_candidates) array of rows; a 1-D boost vector with a
+        1-D candidate list is accepted for a single query.
+        """
+        boosts = np.atleast_2d(boosts)
+        candidates = np.asarray(candidates, dtype=np.int64)
+        shape = candidates.shape
+        candidates = candidates.reshape(len(boosts), -1)
+
+        flat = candidates.ravel()
+        starts = self.movie_indptr[flat]
+        lengths = self.movie_indptr[flat + 1] - starts
+
+        queries = np.repeat(np.arange(len(boosts)), candidates.shape[1])
+        values = boosts[
+            np.repeat(queries, lengths),
+            self.movie_token_ids[_ranges(starts, lengths)]
+        ]
+
+        return _segment_max(values, lengths).reshape(shape)
+
+    def _antecedent_matrix(self):
+        """
+        Sparse tokens x rules matrix of antecedent membership
+        """
+        if self._antecedents is None:
+            self._antecedents = csr_matrix(
+                (np.ones(len(self.token_rules), dtype=np.int32), self.token_rules, self.token_indptr),
+                shape=(len(self.tokens), len(self))
+            )
+        return self._antecedents
+
+
+def build_rule_index(rules, df):
+    """
+    Compile a rules frame into a RuleIndex over the movies in df
+    """
+    antecedents = [sorted(items) for items in rules["antecedents"]]
+    consequents = [sorted(items) for items in rules["consequents"]]
+
+    vocabulary = sorted({token for items in antecedents + consequents for token in items})
+    token_ids = {token: i for i, token in enumerate(vocabulary)}
+
+    antecedent_ids = [[token_ids[token] for token in items] for items in antecedents]
+    consequent_ids = [[token_ids[token] for token in items] for items in consequents]
+
+    # Invert antecedents: token -> rules, via a CSR matrix of rules x tokens
+    antecedent_matrix = _csr(antecedent_ids, len(vocabulary)).T.tocsr()
+    antecedent_matrix.sort_indices()
+
+    consequent_indptr, consequent_tokens = _flatten(consequent_ids)
+
+    # Movie tokens: each movie's feature-store entities that appear in a rule
+    features = get_feature_store(df)
+
+    token_of_entity = np.full(features.n_entities, -1, dtype=np.int32)
+    for token, i in token_ids.items():
+        token_of_entity[features.entity_ids[token]] = i
+
+    tokens = token_of_entity[features.indices]
+    in_rules = tokens >= 0
+
+    movie_of_entry = np.repeat(np.arange(len(features)), np.diff(features.indptr))
+    movie_indptr = np.zeros(len(features) + 1, dtype=np.int64)
+    movie_indptr[1:] = np.cumsum(np.bincount(movie_of_entry[in_rules], minlength=len(features)))
+    movie_token_ids = tokens[in_rules]
+
+    return RuleIndex(
+        tokens=np.array(vocabulary, dtype=str),
+        token_indptr=antecedent_matrix.indptr.astype(np.int64),
+        token_rules=antecedent_matrix.indices.astype(np.int32),
+        antecedent_sizes=np.array([len(items) for items in antecedent_ids], dtype=np.int32),
+        consequent_indptr=consequent_indptr,
+        consequent_tokens=consequent_tokens,
+        confidence=rules["confidence"].to_numpy(dtype=np.float64),
+        movie_indptr=movie_indptr,
+        movie_token_ids=movie_token_ids
+    )
+
+
+def _flatten(lists):
+    indptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(items) for items in lists])
+    data = np.fromiter((i for items in lists for i in items), dtype=np.int32, count=indptr[-1])
+    return indptr, data
+
+
+def _csr(lists, n_columns):
+    indptr, indices = _flatten(lists)
+    data = np.ones(len(indices), dtype=np.int8)
+    return csr_matrix((data, indices, indptr), shape=(len(lists), n_columns))
+
+
+def _ranges(starts, lengths):
+    """
+    Concatenation of range(start, start + length) for each pair
+    """
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(total)
+
+
+def _gather(indptr, data, rows):
+    rows = np.asarray(rows, dtype=np.int64)
+    return data[_ranges(indptr[rows], indptr[rows + 1] - indptr[rows])]
+
+
+def _segment_max(values, lengths):
+    """
+    Max of each consecutive segment of values; 0 for empty segments
+    """
+    out = np.zeros(len(lengths), dtype=np.float64)
+    nonempty = lengths > 0
+    if values.size:
+        starts = (np.cumsum(lengths) - lengths)[nonempty]
+        out[nonempty] = np.maximum.reduceat(values, starts)
+    return out
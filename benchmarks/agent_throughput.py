@@ -0,0 +1,90 @@
+"""
+Agent throughput: sequential sync calls vs. concurrent async calls
+
+    python -m benchmarks.agent_throughput --requests 64 --concurrency 8 --latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from ml.artifacts import load_or_build_artifacts
+from ml.recommender import hybrid_recommend
+from llm.agent import create_agent, create_async_agent
+from llm.response_cache import ResponseCache
+from benchmarks.mock_llm import MockChatModel
+
+
+def misspell(title):
+    """
+    Swap the second and third letters, or double the last one of titles
+    too short for that ('Up' -> 'Upp')
+    """
+    if len(title) >= 3:
+        return title[0] + title[2] + title[1] + title[3:]
+    return title + title[-1:]
+
+
+def make_queries(df, n):
+    # Misspell the title so the exact-title fast path misses and the
+    # request goes through the LLM
+    titles = df["title"].sample(n, replace=True, random_state=0).tolist()
+    return [f"something like {misspell(title)}" for title in titles]
+
+
+def run_sync(df, similarity_matrix, rules, queries, latency):
+    agent = create_agent(
+        df, similarity_matrix, rules, hybrid_recommend,
+        llm=MockChatModel(latency=latency), model="mock", cache=ResponseCache(max_size=0)
+    )
+
+    start = time.perf_counter()
+    for query in queries:
+        agent(query)
+    return time.perf_counter() - start, agent.stats
+
+
+def run_async(df, similarity_matrix, rules, queries, latency, concurrency, timeout):
+    agent = create_async_agent(
+        df, similarity_matrix, rules, hybrid_recommend,
+        llm=MockChatModel(latency=latency), model="mock", cache=ResponseCache(max_size=0),
+        max_concurrency=concurrency, timeout=timeout
+    )
+
+    async def run_all():
+        return await asyncio.gather(*(agent(query) for query in queries))
+
+    start = time.perf_counter()
+    asyncio.run(run_all())
+    return time.perf_counter() - start, agent.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock LLM seconds per call")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--data-dir", default=None)
+    parser.add_argument("--artifact-dir", default=None)
+    args = parser.parse_args()
+
+    df, similarity_matrix, rules = load_or_build_artifacts(args.artifact_dir, args.data_dir)
+    queries = make_queries(df, args.requests)
+
+    sync_seconds, sync_stats = run_sync(df, similarity_matrix, rules, queries, args.latency)
+    async_seconds, async_stats = run_async(
+        df, similarity_matrix, rules, queries, args.latency, args.concurrency, args.timeout
+    )
+
+    print(json.dumps({
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "llm_latency": args.latency,
+        "sync": {"seconds": sync_seconds, "rps": args.requests / sync_seconds, "stats": sync_stats},
+        "async": {"seconds": async_seconds, "rps": args.requests / async_seconds, "stats": async_stats},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+IVF approximate neighbors vs. the exact sparse scan: recall@K, build time
+and single-query latency for a range of n_probe settings
+
+    python -m benchmarks.ann --movies 200000 --probes 1 2 4 8 16 32
+    python -m benchmarks.ann --data-dir data --probes 1 2 4 8 16 32
+
+Recall depends on how clustered the catalog is; the synthetic catalogs
+draw casts at random, so judge the n_probe setting on the real data.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from ml.preprocessing import load_and_clean_data
+from ml.similarity import build_tfidf_matrix, build_neighbor_index, top_neighbors
+from ml.ann import build_ivf_index, build_ann_neighbor_index
+from benchmarks.synthetic import write_catalog
+
+
+def latency_stats(timings):
+    timings = np.asarray(timings) * 1000
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p99_ms": float(np.percentile(timings, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--movies", type=int, default=50000)
+    parser.add_argument("--top-k", type=int, default=19)
+    parser.add_argument("--lists", type=int, default=None, help="IVF lists; about sqrt(movies) by default")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=500, help="Sampled movies for recall and latency")
+    parser.add_argument("--data-dir", default=None, help="Existing catalog; a synthetic one is generated otherwise")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = os.path.join(tmp_dir, "data")
+            write_catalog(data_dir, args.movies)
+
+        df = load_and_clean_data(data_dir)
+
+    tfidf_matrix = build_tfidf_matrix(df)
+    tfidf_t = tfidf_matrix.T.tocsr()
+    top_k = min(args.top_k, len(df) - 1)
+
+    rows = np.random.default_rng(0).choice(len(df), min(args.queries, len(df)), replace=False)
+
+    # Exact reference: one query at a time, as hybrid_recommend would scan
+    exact_scores = np.empty((len(rows), top_k), dtype=np.float32)
+    timings = []
+    for i, row in enumerate(rows):
+        start = time.perf_counter()
+        _, exact_scores[i] = top_neighbors(tfidf_matrix, tfidf_t, [row], top_k)
+        timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    build_neighbor_index(df, top_k=top_k)
+    exact_build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = build_ivf_index(tfidf_matrix, n_lists=args.lists)
+    build_seconds = time.perf_counter() - start
+
+    results = []
+    for n_probe in args.probes:
+        _, scores = index.search(tfidf_matrix[rows], top_k, n_probe=n_probe, exclude=rows)
+
+        probe_timings = []
+        for row in rows:
+            start = time.perf_counter()
+            index.search(tfidf_matrix[[row]], top_k, n_probe=n_probe, exclude=[row])
+            probe_timings.append(time.perf_counter() - start)
+
+        # The whole neighbor index, as an artifact build with similarity="ann" makes it
+        start = time.perf_counter()
+        build_ann_neighbor_index(df, top_k=top_k, n_lists=args.lists, n_probe=n_probe)
+        neighbor_build_seconds = time.perf_counter() - start
+
+        results.append({
+            "n_probe": min(n_probe, index.n_lists),
+            "neighbor_build_seconds": neighbor_build_seconds,
+            # A neighbor counts when it scores at least the exact k-th score (ties included)
+            "recall_at_k": float((scores >= exact_scores[:, -1:] - 1e-6).mean()),
+            **latency_stats(probe_timings),
+        })
+
+    print(json.dumps({
+        "movies": len(df),
+        "top_k": top_k,
+        "n_lists": index.n_lists,
+        "exact_build_seconds": exact_build_seconds,
+        "ivf_build_seconds": build_seconds,
+        "exact": latency_stats(timings),
+        "ivf": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
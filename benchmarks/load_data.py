@@ -0,0 +1,87 @@
+"""
+load_and_clean_data vs. the original row-by-row ast.literal_eval loader
+
+    python -m benchmarks.load_data --movies 50000
+"""
+import argparse
+import ast
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from ml.preprocessing import load_and_clean_data, get_data_paths
+from benchmarks.synthetic import write_catalog
+
+
+def legacy_load_and_clean_data(data_dir):
+    """
+    The loader as it was before the columnar rewrite, kept as a baseline
+    """
+    def safe_parse(x):
+        try:
+            return ast.literal_eval(x)
+        except (ValueError, SyntaxError):
+            return []
+
+    movies_path, credits_path = get_data_paths(data_dir)
+
+    movies = pd.read_csv(movies_path)
+    credits = pd.read_csv(credits_path)
+
+    df = movies.merge(credits, on='title')
+
+    df['genres'] = df['genres'].apply(safe_parse)
+    df['cast'] = df['cast'].apply(safe_parse)
+
+    df['genres'] = df['genres'].apply(lambda x: [i['name'] for i in x] if isinstance(x, list) else [])
+    df['cast'] = df['cast'].apply(lambda x: [i['name'] for i in x[:5]] if isinstance(x, list) else [])
+
+    df = df[['title', 'genres', 'cast', 'vote_average', 'popularity']]
+    df = df.drop_duplicates(subset='title').reset_index(drop=True)
+    df['combined'] = df['genres'].apply(lambda x: ' '.join(x)) + ' ' + df['cast'].apply(lambda x: ' '.join(x))
+
+    return df
+
+
+def best_of(repeat, fn, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--movies", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=None, help="Existing catalog; a synthetic one is generated otherwise")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = os.path.join(tmp_dir, "data")
+            # No repeated titles: the legacy title join would pair their
+            # credits differently, and the frames could not be compared
+            write_catalog(data_dir, args.movies, duplicate_rate=0)
+
+        legacy_seconds, legacy_df = best_of(args.repeat, legacy_load_and_clean_data, data_dir)
+        seconds, df = best_of(args.repeat, load_and_clean_data, data_dir)
+
+        print(json.dumps({
+            "movies": len(df),
+            "legacy_seconds": legacy_seconds,
+            "seconds": seconds,
+            "speedup": legacy_seconds / seconds,
+            # The legacy loader also builds the text column nothing reads any more
+            "same_frame": bool(legacy_df.drop(columns='combined').equals(df)),
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Load test of the HTTP service against the mock LLM
+
+    python -m benchmarks.load_test --movies 5000 --workers 2 --connections 8 --requests 2000
+
+Starts server.py's app under uvicorn on a synthetic catalog (or --data-dir),
+then drives each endpoint in turn from --connections keep-alive clients and
+reports throughput, latency percentiles and status codes per endpoint.
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ml.artifacts import ensure_artifacts, load_artifacts
+from benchmarks.agent_throughput import make_queries
+from benchmarks.mock_llm import MockChatModel
+from benchmarks.synthetic import write_catalog
+
+
+def mock_app():
+    """
+    server.create_app with the mock LLM, for uvicorn --factory
+    """
+    from server import create_app
+
+    return create_app(
+        artifact_dir=os.environ["MOVIE_RECOMMENDER_ARTIFACT_DIR"],
+        data_dir=os.environ["MOVIE_RECOMMENDER_DATA_DIR"],
+        llm=MockChatModel(latency=float(os.environ.get("MOCK_LLM_LATENCY", 0.2))),
+        model="mock",
+        request_timeout=float(os.environ.get("MOVIE_RECOMMENDER_REQUEST_TIMEOUT", 10.0)),
+        agent_timeout=float(os.environ.get("MOVIE_RECOMMENDER_AGENT_TIMEOUT", 8.0)),
+    )
+
+
+def latency_stats(timings):
+    timings = np.asarray(timings) * 1000
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99)),
+    }
+
+
+def run_client(port, path, bodies):
+    """
+    Send bodies one after another over a single keep-alive connection
+    """
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    timings = []
+    statuses = Counter()
+
+    for body in bodies:
+        payload = json.dumps(body)
+        start = time.perf_counter()
+        connection.request("POST", path, payload, {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        timings.append(time.perf_counter() - start)
+        statuses[response.status] += 1
+
+    connection.close()
+    return timings, statuses
+
+
+def run_endpoint(port, path, bodies, connections):
+    shares = [bodies[i::connections] for i in range(connections)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(connections) as pool:
+        results = list(pool.map(lambda share: run_client(port, path, share), shares))
+    elapsed = time.perf_counter() - start
+
+    timings = [t for result, _ in results for t in result]
+    statuses = sum((statuses for _, statuses in results), Counter())
+
+    return {
+        "requests": len(bodies),
+        "seconds": elapsed,
+        "requests_per_second": len(bodies) / elapsed,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        **latency_stats(timings),
+    }
+
+
+def wait_until_ready(port, server, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server not ready after {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movies", type=int, default=5000, help="Synthetic catalog size")
+    parser.add_argument("--data-dir", default=None, help="Existing catalog; a synthetic one is generated otherwise")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per endpoint")
+    parser.add_argument("--batch-size", type=int, default=64, help="Titles per /recommend/batch request")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Mock LLM seconds per call")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = os.path.join(tmp_dir, "data")
+            write_catalog(data_dir, args.movies)
+
+        artifact_dir = os.path.join(tmp_dir, "artifacts")
+        df, _, _ = load_artifacts(ensure_artifacts(artifact_dir, data_dir, n_jobs=-1))
+
+        env = dict(
+            os.environ,
+            MOVIE_RECOMMENDER_ARTIFACT_DIR=artifact_dir,
+            MOVIE_RECOMMENDER_DATA_DIR=data_dir,
+            MOVIE_RECOMMENDER_REQUEST_TIMEOUT=str(args.timeout),
+            MOVIE_RECOMMENDER_AGENT_TIMEOUT=str(args.timeout * 0.8),
+            MOCK_LLM_LATENCY=str(args.llm_latency),
+        )
+        server = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "benchmarks.load_test:mock_app", "--factory",
+            "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning",
+        ], env=env)
+
+        try:
+            wait_until_ready(args.port, server, timeout=120)
+
+            titles = df["title"].sample(args.requests * args.batch_size, replace=True, random_state=0).tolist()
+            batches = [titles[i:i + args.batch_size] for i in range(0, len(titles), args.batch_size)]
+
+            results = {
+                "/recommend": run_endpoint(
+                    args.port, "/recommend", [{"movie": title} for title in titles[:args.requests]],
+                    args.connections
+                ),
+                "/recommend/batch": run_endpoint(
+                    args.port, "/recommend/batch", [{"movies": batch} for batch in batches],
+                    args.connections
+                ),
+                # Misspelled titles, so every request goes through the mock LLM
+                "/agent": run_endpoint(
+                    args.port, "/agent", [{"message": query} for query in make_queries(df, args.requests)],
+                    args.connections
+                ),
+            }
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps({
+        "movies": len(df),
+        "workers": args.workers,
+        "connections": args.connections,
+        "batch_size": args.batch_size,
+        "llm_latency_ms": args.llm_latency * 1000,
+        "endpoints": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+from langchain_core.language_models.chat_models import SimpleChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class MockChatModel(SimpleChatModel):
+    """
+    Local stand-in for ChatOllama with a fixed per-call latency
+
+    Extraction prompts get back whatever follows the last ' like ' in the
+    user's message; formatting prompts get a canned reply.
+    """
+
+    latency: float = 0.2
+
+    @property
+    def _llm_type(self):
+        return "mock-chat"
+
+    def _reply(self, messages):
+        system, human = messages[0].content, messages[-1].content
+
+        if "Extract the movie name" in system:
+            return human.rsplit(" like ", 1)[-1] if " like " in human else "NONE"
+
+        return "Here are a few picks I think you'll love!"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return self._reply(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        message = AIMessage(content=self._reply(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
@@ -0,0 +1,257 @@
+"""
+Stage-by-stage benchmark of the whole pipeline on synthetic catalogs
+
+    python -m benchmarks.suite --sizes 5000 50000 500000 --out results.json
+    python -m benchmarks.suite --compare baseline.json results.json
+
+Each catalog size runs in a fresh process, so peak RSS figures are not
+inherited from a previous size. peak_rss_mb is the process high-water mark
+at the end of each stage, so it only grows from stage to stage.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+from ml.preprocessing import load_and_clean_data
+from ml.similarity import build_similarity_matrix, build_neighbor_index, build_embedding_index, get_tfidf_matrix
+from ml.association import build_association_rules, build_rule_index
+from ml.recommender import hybrid_recommend, hybrid_recommend_many, CANDIDATES
+from ml.catalog import get_catalog_index
+from ml.title_index import get_title_index
+from ml.artifacts import EMBEDDING_DIM
+from llm.agent import create_agent
+from llm.response_cache import ResponseCache
+from benchmarks.agent_throughput import make_queries
+from benchmarks.mock_llm import MockChatModel
+from benchmarks.synthetic import write_catalog
+
+
+# build_similarity_matrix is a dense N x N matrix; larger catalogs skip it
+DENSE_LIMIT = 20000
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def latency_stats(timings):
+    timings = np.asarray(timings) * 1000
+    return {
+        "calls": len(timings),
+        "mean_ms": float(timings.mean()),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99)),
+    }
+
+
+def timed_stage(stages, name, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    stages[name] = {"seconds": time.perf_counter() - start, "peak_rss_mb": peak_rss_mb()}
+    return result
+
+
+def timed_calls(fn, inputs):
+    timings = []
+    for value in inputs:
+        start = time.perf_counter()
+        fn(value)
+        timings.append(time.perf_counter() - start)
+    return latency_stats(timings)
+
+
+def run_catalog(n_movies, queries, llm_latency, n_jobs, seed):
+    """
+    Benchmark every stage on one synthetic catalog of n_movies titles
+    """
+    stages = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = os.path.join(tmp_dir, "data")
+        timed_stage(stages, "write_catalog", write_catalog, data_dir, n_movies, seed=seed)
+        df = timed_stage(stages, "load_and_clean_data", load_and_clean_data, data_dir)
+
+    similarity_matrix = None
+    if len(df) <= DENSE_LIMIT:
+        similarity_matrix = timed_stage(stages, "build_similarity_matrix", build_similarity_matrix, df)
+
+    similarity_index = timed_stage(stages, "build_neighbor_index", build_neighbor_index, df, n_jobs=n_jobs)
+    embedding_index = timed_stage(stages, "build_embedding_index", build_embedding_index, df, dim=EMBEDDING_DIM)
+    rules_frame = timed_stage(stages, "build_association_rules", build_association_rules, df, n_jobs=n_jobs)
+    rules = timed_stage(stages, "build_rule_index", build_rule_index, rules_frame, df)
+
+    titles = df["title"].sample(queries, replace=True, random_state=seed).tolist()
+    stages["hybrid_recommend"] = timed_calls(
+        lambda title: hybrid_recommend(title, df, similarity_index, rules), titles
+    )
+    stages["hybrid_recommend"]["peak_rss_mb"] = peak_rss_mb()
+
+    stages["embedding_recommend"] = timed_calls(
+        lambda title: hybrid_recommend(title, df, embedding_index, rules), titles
+    )
+    stages["embedding_recommend"].update(
+        recall_at_k=embedding_recall(df, embedding_index, similarity_index, titles), peak_rss_mb=peak_rss_mb()
+    )
+
+    filters = filter_cases(df)
+    stages["filtered_recommend"] = timed_calls(
+        lambda i: hybrid_recommend(titles[i], df, similarity_index, rules, **filters[i % len(filters)]),
+        range(len(titles))
+    )
+    if similarity_matrix is not None:
+        stages["filtered_recommend"]["dense_agreement"] = filtered_agreement(
+            df, similarity_index, similarity_matrix, rules, titles, filters
+        )
+
+    # Misspelled titles, so every request goes through both mock LLM calls
+    agent = create_agent(
+        df, similarity_index, rules, hybrid_recommend,
+        llm=MockChatModel(latency=llm_latency), model="mock", cache=ResponseCache(max_size=0)
+    )
+    stages["agent"] = timed_calls(agent, make_queries(df, queries))
+    stages["agent"].update(llm_latency_ms=llm_latency * 1000, stats=dict(agent.stats), peak_rss_mb=peak_rss_mb())
+
+    return {"movies": len(df), "rules": len(rules), "stages": stages}
+
+
+def filter_cases(df):
+    """
+    A spread of filters from broad to narrow, cycled through by the
+    filtered stage
+    """
+    genres = get_catalog_index(df).genre_names()
+    return [
+        {"genre": genres[0]},
+        {"genre": genres[len(genres) // 2], "min_rating": 6.0},
+        {"min_rating": 8.0},
+        {"min_popularity": float(df["popularity"].quantile(0.9))},
+    ]
+
+
+def filtered_agreement(df, similarity_index, similarity_matrix, rules, titles, filters):
+    """
+    Share of filtered queries whose recommendations come out the same from
+    the neighbor index as from the dense matrix
+    """
+    same = []
+    for f in filters:
+        ours, _, _ = hybrid_recommend_many(titles, df, similarity_index, rules, **f)
+        dense, _, _ = hybrid_recommend_many(titles, df, similarity_matrix, rules, **f)
+        same.append((ours == dense).all(axis=1))
+    return float(np.concatenate(same).mean())
+
+
+def embedding_recall(df, embedding_index, similarity_index, titles, k=CANDIDATES, block_size=64):
+    """
+    Share of the k candidates the LSA embeddings pick per title that are
+    also in the exact TF-IDF top k (a tie with the exact k-th score counts)
+    """
+    tfidf_matrix = get_tfidf_matrix(df)
+    rows = get_title_index(df).rows_of(titles)
+    k = min(k, similarity_index.top_k)
+
+    hits = []
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+
+        scores = embedding_index[block]
+        scores[np.arange(len(block)), block] = -np.inf
+        picked = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        exact = np.asarray(
+            tfidf_matrix[np.repeat(block, k)].multiply(tfidf_matrix[picked.ravel()]).sum(axis=1)
+        ).reshape(len(block), k)
+        hits.append(exact >= np.asarray(similarity_index.scores[block, k - 1:k]) - 1e-6)
+
+    return float(np.concatenate(hits).mean())
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    """
+    Per-stage time ratio new / old for every catalog size in both files
+    """
+    with open(old_path) as f:
+        old = {run["size"]: run for run in json.load(f)["runs"]}
+    with open(new_path) as f:
+        new = {run["size"]: run for run in json.load(f)["runs"]}
+
+    report = {}
+    for size in sorted(old.keys() & new.keys()):
+        report[size] = {}
+        for stage, result in new[size]["stages"].items():
+            before = old[size]["stages"].get(stage)
+            if before is None:
+                continue
+            key = "seconds" if "seconds" in result else "p99_ms"
+            report[size][stage] = {
+                key: [before[key], result[key]],
+                "ratio": result[key] / before[key] if before[key] else None,
+                "peak_rss_mb": [before.get("peak_rss_mb"), result.get("peak_rss_mb")],
+            }
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 50000, 500000])
+    parser.add_argument("--queries", type=int, default=200, help="Timed calls per latency stage")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Mock LLM seconds per call")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes for the build stages")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="Write the JSON here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        print(json.dumps(compare(*args.compare), indent=2))
+        return
+
+    runs = []
+    for size in args.sizes:
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+            result = pool.submit(run_catalog, size, args.queries, args.llm_latency, args.jobs, args.seed).result()
+        runs.append({"size": size, **result})
+
+    output = json.dumps({
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "queries": args.queries,
+        "seed": args.seed,
+        "runs": runs,
+    }, indent=2)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Synthetic TMDB-shaped catalogs for benchmarking
+
+    python -m benchmarks.synthetic --movies 50000 --out /tmp/tmdb_50k
+"""
+import argparse
+import csv
+import json
+import os
+import random
+
+
+GENRES = [
+    "Action", "Adventure", "Animation", "Comedy", "Crime", "Documentary",
+    "Drama", "Family", "Fantasy", "Foreign", "History", "Horror", "Music",
+    "Mystery", "Romance", "Science Fiction", "TV Movie", "Thriller", "War",
+    "Western",
+]
+
+MOVIE_COLUMNS = [
+    "budget", "genres", "homepage", "id", "keywords", "original_language",
+    "original_title", "overview", "popularity", "production_companies",
+    "production_countries", "release_date", "revenue", "runtime",
+    "spoken_languages", "status", "tagline", "title", "vote_average",
+    "vote_count",
+]
+
+CREDIT_COLUMNS = ["movie_id", "title", "cast", "crew"]
+
+WORDS = (
+    "night star city last love dark king war day lost man girl house secret "
+    "dead world return rise fall blood time story life shadow fire road game "
+    "heart ghost dream storm iron silent wild golden summer winter"
+).split()
+
+
+def _name(rng):
+    first = "".join(rng.choice("bcdfghjklmnprstvz") + rng.choice("aeiou") for _ in range(rng.randint(2, 3)))
+    last = "".join(rng.choice("bcdfghjklmnprstvz") + rng.choice("aeiou") for _ in range(rng.randint(2, 4)))
+    return f"{first.title()} {last.title()}"
+
+
+def write_catalog(data_dir, n_movies, seed=0, duplicate_rate=0.01):
+    """
+    Write tmdb_5000_movies.csv and tmdb_5000_credits.csv with n_movies rows
+
+    Cast members follow a long-tailed popularity distribution, like the
+    real data. About duplicate_rate of the titles repeat an earlier title
+    (remakes), and the credits carry bulky crew JSON that a loader has to
+    skip over.
+    """
+    rng = random.Random(seed)
+    os.makedirs(data_dir, exist_ok=True)
+
+    actors = [_name(rng) for _ in range(max(50, n_movies // 2))]
+    weights = [1.0 / (rank + 1) for rank in range(len(actors))]
+
+    titles = []
+
+    movies_path = os.path.join(data_dir, "tmdb_5000_movies.csv")
+    credits_path = os.path.join(data_dir, "tmdb_5000_credits.csv")
+
+    with open(movies_path, "w", newline="") as movies_file, open(credits_path, "w", newline="") as credits_file:
+        movies = csv.writer(movies_file)
+        credits = csv.writer(credits_file)
+        movies.writerow(MOVIE_COLUMNS)
+        credits.writerow(CREDIT_COLUMNS)
+
+        for i in range(n_movies):
+            movie_id = 100000 + i
+
+            if titles and rng.random() < duplicate_rate:
+                title = rng.choice(titles)
+            else:
+                title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title() + f" {i}"
+            titles.append(title)
+
+            genres = [{"id": GENRES.index(g), "name": g} for g in rng.sample(GENRES, rng.randint(1, 4))]
+            keywords = [{"id": k, "name": rng.choice(WORDS)} for k in range(rng.randint(0, 8))]
+            cast = [
+                {
+                    "cast_id": order, "character": rng.choice(WORDS).title(),
+                    "credit_id": f"{movie_id:x}{order:04d}", "gender": rng.randint(0, 2),
+                    "id": rng.randint(1, 10 ** 6), "name": name, "order": order,
+                }
+                for order, name in enumerate(dict.fromkeys(rng.choices(actors, weights, k=rng.randint(3, 25))))
+            ]
+            crew = [
+                {
+                    "credit_id": f"{movie_id:x}c{k:04d}", "department": "Crew", "gender": 0,
+                    "id": rng.randint(1, 10 ** 6), "job": "Grip", "name": _name(rng),
+                }
+                for k in range(rng.randint(5, 40))
+            ]
+
+            movies.writerow([
+                rng.randint(0, 2 * 10 ** 8), json.dumps(genres), "", movie_id, json.dumps(keywords),
+                "en", title, " ".join(rng.choices(WORDS, k=40)), round(rng.expovariate(1 / 20), 6),
+                "[]", "[]", f"{rng.randint(1950, 2016)}-01-01", rng.randint(0, 10 ** 9),
+                rng.randint(80, 180), "[]", "Released", "", title,
+                round(rng.uniform(0, 10), 1), rng.randint(0, 10000),
+            ])
+            credits.writerow([movie_id, title, json.dumps(cast), json.dumps(crew)])
+
+    return movies_path, credits_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--movies", type=int, default=5000)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(write_catalog(args.out, args.movies, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from ml.preprocessing import get_derived
+from ml.features import GENRE, CAST, get_feature_store
+
+
+ALL_GENRES = None
+
+# Compiled filter masks kept per catalog index
+MASK_CACHE_SIZE = 32
+
+# Sort key -> (column, descending)
+SORT_KEYS = {
+    "popularity": ("popularity", True),
+    "rating": ("vote_average", True),
+    "title": ("title", False),
+}
+
+
+class CatalogIndex:
+    """
+    Browse queries (genre filter, minimum rating, sort, page) over
+    precomputed orders
+
+    Movie lists are stored CSR-style: list 0 holds every movie, list g + 1
+    the movies of genres[g], at indptr[l]:indptr[l + 1] in each of the
+    by_<key> arrays, each already sorted by that key. neg_ratings holds
+    -vote_average aligned with by_rating, so the number of movies in a
+    list at or above a rating is one binary search.
+    """
+
+    ARRAYS = ("genres", "indptr", "ratings", "popularity", "by_popularity", "by_rating", "by_title", "neg_ratings")
+
+    def __init__(self, genres, indptr, ratings, popularity, by_popularity, by_rating, by_title, neg_ratings):
+        self.genres = genres
+        self.indptr = indptr
+        self.ratings = ratings
+        self.popularity = popularity
+        self.by_popularity = by_popularity
+        self.by_rating = by_rating
+        self.by_title = by_title
+        self.neg_ratings = neg_ratings
+        self._genre_ids = {name: i + 1 for i, name in enumerate(genres.tolist())}
+        self._masks = OrderedDict()
+        self._masks_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ratings)
+
+    def genre_names(self):
+        """
+        Every genre in the catalog, sorted
+        """
+        return self.genres.tolist()
+
+    def _list_bounds(self, genre):
+        if genre is ALL_GENRES:
+            lst = 0
+        else:
+            lst = self._genre_ids.get(genre)
+            if lst is None:
+                raise KeyError(f"Unknown genre: {genre}")
+        return self.indptr[lst], self.indptr[lst + 1]
+
+    def count(self, genre=ALL_GENRES, min_rating=0.0):
+        """
+        Number of movies in genre rated at least min_rating
+        """
+        start, end = self._list_bounds(genre)
+        return int(np.searchsorted(self.neg_ratings[start:end], -min_rating, side="right"))
+
+    def query(self, genre=ALL_GENRES, min_rating=0.0, sort="popularity", offset=0, limit=20):
+        """
+        One page of a filtered, sorted listing
+
+        Returns (total, rows): the number of matching movies and the
+        positional rows of matches offset to offset + limit.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {sort}")
+
+        start, end = self._list_bounds(genre)
+        total = int(np.searchsorted(self.neg_ratings[start:end], -min_rating, side="right"))
+        ordered = getattr(self, f"by_{sort}")[start:end]
+
+        offset = max(0, min(offset, total))
+        stop = min(offset + limit, total)
+
+        # Sorted by rating (or nothing filtered out): the matches are a prefix
+        if sort == "rating" or total == end - start:
+            return total, np.asarray(ordered[offset:stop])
+
+        return total, self._filtered_page(ordered, min_rating, offset, stop)
+
+    def mask(self, genre=ALL_GENRES, min_rating=None, min_popularity=None):
+        """
+        Boolean mask over every movie of those matching all the given
+        constraints, or None when there are none
+
+        Masks are compiled once per distinct filter and reused, so
+        recommenders can apply them to a candidate score vector directly.
+        """
+        if genre is ALL_GENRES and min_rating is None and min_popularity is None:
+            return None
+
+        key = (genre, min_rating, min_popularity)
+        with self._masks_lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+
+        start, end = self._list_bounds(genre)
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.by_rating[start:end]] = True
+
+        if min_rating is not None:
+            mask &= self.ratings >= min_rating
+        if min_popularity is not None:
+            mask &= self.popularity >= min_popularity
+
+        mask.flags.writeable = False
+        with self._masks_lock:
+            self._masks[key] = mask
+            if len(self._masks) > MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+
+        return mask
+
+    def _filtered_page(self, ordered, min_rating, offset, stop):
+        """
+        Matches offset to stop of ordered, scanning only as far as needed
+        """
+        found = []
+        n_found = 0
+        chunk = max(256, 2 * stop)
+
+        position = 0
+        while n_found < stop and position < len(ordered):
+            block = np.asarray(ordered[position:position + chunk])
+            block = block[self.ratings[block] >= min_rating]
+            found.append(block)
+            n_found += len(block)
+            position += chunk
+            chunk *= 2
+
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(found)[offset:stop]
+
+
+def build_catalog_index(df):
+    """
+    Genre lists and their by-key orders from df and its feature store
+    """
+    features = get_feature_store(df)
+    n_movies = len(df)
+
+    genre_entities = np.flatnonzero(features.kinds == GENRE)
+    names = features.names[genre_entities]
+    by_name = np.argsort(names, kind="stable")
+    genres = names[by_name]
+
+    # Entity id -> list number (genre lists start at 1; other entities -1)
+    list_of = np.full(features.n_entities, -1, dtype=np.int64)
+    list_of[genre_entities[by_name]] = np.arange(1, len(genres) + 1)
+
+    entity_rows = np.repeat(np.arange(n_movies), np.diff(features.indptr))
+    entity_lists = list_of[np.asarray(features.indices)]
+    is_genre = entity_lists >= 0
+
+    rows = np.concatenate([np.arange(n_movies), entity_rows[is_genre]])
+    lists = np.concatenate([np.zeros(n_movies, dtype=np.int64), entity_lists[is_genre]])
+
+    indptr = np.zeros(len(genres) + 2, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(lists, minlength=len(genres) + 1))
+
+    ratings = df["vote_average"].to_numpy(dtype=np.float64)
+    orders = {}
+    for key, (column, descending) in SORT_KEYS.items():
+        values = df[column].to_numpy()
+        order = np.argsort(-values if descending else values, kind="stable")
+        rank = np.empty(n_movies, dtype=np.int64)
+        rank[order] = np.arange(n_movies)
+
+        # Group by list, keeping the global order within each list
+        orders[key] = rows[np.lexsort((rank[rows], lists))].astype(np.int32)
+
+    return CatalogIndex(
+        genres=genres,
+        indptr=indptr,
+        ratings=ratings,
+        popularity=df["popularity"].to_numpy(dtype=np.float64),
+        by_popularity=orders["popularity"],
+        by_rating=orders["rating"],
+        by_title=orders["title"],
+        neg_ratings=-ratings[orders["rating"]],
+    )
+
+
+def get_catalog_index(df):
+    """
+    The browse index for df, built on first use and reused afterwards
+    """
+    return get_derived(df, "catalog_index", build_catalog_index)
+
+
+class CatalogSummary:
+    """
+    Headline catalog statistics and the title list, computed once per build
+
+    titles is sorted, ready for the title picker.
+    """
+
+    FIELDS = ("movies", "genres", "actors", "mean_rating", "titles")
+
+    def __init__(self, movies, genres, actors, mean_rating, titles):
+        self.movies = movies
+        self.genres = genres
+        self.actors = actors
+        self.mean_rating = mean_rating
+        self.titles = titles
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+def build_catalog_summary(df):
+    """
+    Summary of df, counting genres and actors from its feature store
+    """
+    features = get_feature_store(df)
+
+    used = np.zeros(features.n_entities, dtype=bool)
+    used[np.asarray(features.indices)] = True
+
+    catalog = get_catalog_index(df)
+    title_order = catalog.by_title[catalog.indptr[0]:catalog.indptr[1]]
+
+    return CatalogSummary(
+        movies=len(df),
+        genres=int((used & (features.kinds == GENRE)).sum()),
+        actors=int((used & (features.kinds == CAST)).sum()),
+        mean_rating=float(df["vote_average"].mean()) if len(df) else 0.0,
+        titles=df["title"].to_numpy()[title_order].tolist(),
+    )
+
+
+def get_catalog_summary(df):
+    """
+    The summary of df, built on first use and reused afterwards
+    """
+    return get_derived(df, "catalog_summary", build_catalog_summary)
@@ -0,0 +1,156 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from ml.preprocessing import get_derived
+
+
+GENRE = 0
+CAST = 1
+
+KIND_NAMES = ("genre", "cast")
+
+
+def entity_label(kind, name):
+    """
+    Name qualified by its kind, 'genre:Music' vs 'cast:Music', so the same
+    string in two kinds stays two entities
+    """
+    return f"{KIND_NAMES[kind]}:{name}"
+
+
+class FeatureStore:
+    """
+    Integer-encoded genre/cast entities per movie
+
+    Entities are whole names ('Science Fiction', 'Tom Hanks'), so multi-word
+    names are never split into unrelated tokens, and entities are told apart
+    by kind as well as name (see entity_label). Movie i has the entity ids
+    indices[indptr[i]:indptr[i + 1]], sorted ascending.
+    """
+
+    ARRAYS = ("names", "kinds", "indptr", "indices")
+
+    def __init__(self, names, kinds, indptr, indices):
+        self.names = names
+        self.kinds = kinds
+        self.indptr = indptr
+        self.indices = indices
+        self._matrix = None
+        self._labels = None
+        self._entity_ids = None
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def n_entities(self):
+        return len(self.names)
+
+    @property
+    def labels(self):
+        """
+        Kind-qualified entity names, the items association rules are mined over
+        """
+        if self._labels is None:
+            self._labels = [entity_label(kind, name) for kind, name in zip(self.kinds.tolist(), self.names.tolist())]
+        return self._labels
+
+    @property
+    def entity_ids(self):
+        """
+        Entity label -> id
+        """
+        if self._entity_ids is None:
+            self._entity_ids = {label: i for i, label in enumerate(self.labels)}
+        return self._entity_ids
+
+    def entities_of(self, idx):
+        return self.indices[self.indptr[idx]:self.indptr[idx + 1]]
+
+    def entity_labels(self, idx):
+        return [self.labels[entity] for entity in self.entities_of(idx).tolist()]
+
+    def take(self, rows):
+        """
+        Store with only the given movies, keeping the entity vocabulary
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(lengths)
+        positions = np.repeat(starts - indptr[:-1], lengths) + np.arange(indptr[-1])
+
+        return FeatureStore(self.names, self.kinds, indptr, np.asarray(self.indices)[positions])
+
+    def append(self, other):
+        """
+        Store with other's movies after this one's; other must have been
+        built with base=self, so its vocabulary extends this one
+        """
+        return FeatureStore(
+            names=other.names,
+            kinds=other.kinds,
+            indptr=np.concatenate([self.indptr[:-1], other.indptr + self.indptr[-1]]),
+            indices=np.concatenate([self.indices, other.indices])
+        )
+
+    def matrix(self):
+        """
+        Binary movies x entities CSR matrix
+        """
+        if self._matrix is None:
+            self._matrix = csr_matrix(
+                (np.ones(len(self.indices), dtype=np.float32), self.indices, self.indptr),
+                shape=(len(self), self.n_entities)
+            )
+        return self._matrix
+
+
+def build_feature_store(df, base=None):
+    """
+    Encode df's genres and cast lists as entity ids, in one pass over the frame
+
+    With a base store, its entity ids are kept and unseen names are
+    numbered after them, so the result can be appended to base.
+    """
+    entity_ids = dict(base.entity_ids) if base is not None else {}
+    names = base.names.tolist() if base is not None else []
+    kinds = base.kinds.tolist() if base is not None else []
+
+    lengths = np.zeros(len(df), dtype=np.int64)
+    indices = []
+
+    for row, (genres, cast) in enumerate(zip(df["genres"], df["cast"])):
+        movie_entities = set()
+
+        for kind, values in ((GENRE, genres), (CAST, cast)):
+            for name in values:
+                label = entity_label(kind, name)
+                entity = entity_ids.get(label)
+                if entity is None:
+                    entity = entity_ids[label] = len(names)
+                    names.append(name)
+                    kinds.append(kind)
+                movie_entities.add(entity)
+
+        lengths[row] = len(movie_entities)
+        indices.extend(sorted(movie_entities))
+
+    indptr = np.zeros(len(df) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(lengths)
+
+    return FeatureStore(
+        names=np.array(names, dtype=str),
+        kinds=np.array(kinds, dtype=np.int8),
+        indptr=indptr,
+        indices=np.array(indices, dtype=np.int32)
+    )
+
+
+def get_feature_store(df):
+    """
+    The feature store for df, built on first use and reused afterwards
+    """
+    return get_derived(df, "features", build_feature_store)
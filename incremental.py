@@ -0,0 +1,387 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, vstack
+
+from ml.preprocessing import get_derived
+from ml.features import build_feature_store, get_feature_store
+from ml.similarity import NeighborIndex, build_neighbor_index, top_neighbors, idf_weights, tfidf_vectors
+from ml.association import build_association_rules, build_rule_index
+from ml.rule_mining import mine_frequent_itemsets, generate_rules, support_count
+from ml.title_index import get_title_index
+from ml.recommender import hybrid_recommend_many
+
+
+class IncrementalModel:
+    """
+    A model build that takes new and removed movies without a full rebuild
+
+    IDF weights stay fixed between refreshes, so adding a movie leaves every
+    other movie's TF-IDF vector untouched: only the new rows and the rows
+    they displace from a top-K list get new neighbor lists. Entities never
+    seen before are appended to the vocabulary with the IDF they have on
+    arrival. Drift is measured per movie, as the distance between its
+    stored unit vector and the one a rebuild would fit, which bounds how
+    far its similarity scores can be off. Movies drifting past
+    idf_tolerance are re-vectorized under refitted weights and their
+    neighborhoods recomputed; only when more than refresh_ratio of the
+    catalog drifted is the whole neighbor index rebuilt.
+
+    Rule support is recounted from the added/removed movies alone. Itemsets
+    are tracked down to watch_ratio x min_support, which keeps the counts
+    exact until enough movies were added that an untracked itemset could
+    have become frequent; the itemsets are mined again at that point.
+
+    consistency_check() measures the divergence from a full rebuild.
+    """
+
+    def __init__(self, df, similarity_index=None, top_k=50, min_support=0.02, min_confidence=0.3,
+                 max_len=None, max_rules=None, watch_ratio=0.5, idf_tolerance=0.1, refresh_ratio=0.1,
+                 block_size=256):
+        self.min_support = min_support
+        self.min_confidence = min_confidence
+        self.max_len = max_len
+        self.max_rules = max_rules
+        self.watch_ratio = watch_ratio
+        self.idf_tolerance = idf_tolerance
+        self.refresh_ratio = refresh_ratio
+        self.block_size = block_size
+
+        self.df = df
+        self.features = get_feature_store(df)
+
+        self.document_frequency = np.bincount(self.features.indices, minlength=self.features.n_entities)
+        self.idf = idf_weights(self.document_frequency, len(df))
+        self.tfidf = tfidf_vectors(self.features.matrix(), self.idf)
+
+        if similarity_index is None:
+            similarity_index = build_neighbor_index(df, top_k=top_k, block_size=block_size)
+
+        # Private writable copies; loaded artifacts are read-only memory maps
+        self.neighbors = np.array(similarity_index.neighbors)
+        self.scores = np.array(similarity_index.scores)
+
+        self._mine_itemsets()
+        self._update_rules()
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def top_k(self):
+        return self.neighbors.shape[1]
+
+    @property
+    def similarity_index(self):
+        return NeighborIndex(self.neighbors, self.scores)
+
+    def add_movies(self, movies):
+        """
+        Append movies (a frame with title, genres, cast, vote_average and
+        popularity) and return their rows
+
+        Like load_and_clean_data, a title that is already in the catalog, or
+        repeats earlier in movies, is skipped.
+        """
+        movies = movies[~movies["title"].duplicated()]
+        movies = movies[get_title_index(self.df).rows_of(movies["title"].tolist()) < 0]
+        movies = movies[["title", "genres", "cast", "vote_average", "popularity"]].copy()
+
+        n_old = len(self.df)
+        rows = np.arange(n_old, n_old + len(movies))
+        if len(movies) == 0:
+            return rows
+
+        added = build_feature_store(movies, base=self.features)
+        features = self.features.append(added)
+
+        # New entities get the IDF they have on arrival; known ones keep theirs
+        document_frequency = np.zeros(features.n_entities, dtype=np.int64)
+        document_frequency[:len(self.document_frequency)] = self.document_frequency
+        document_frequency += np.bincount(added.indices, minlength=features.n_entities)
+
+        new_entities = np.arange(len(self.idf), features.n_entities)
+        self.idf = np.concatenate([self.idf, idf_weights(document_frequency[new_entities], len(features))])
+        self.document_frequency = document_frequency
+
+        # Old vectors only gain (empty) columns for the new entities
+        self.tfidf.resize((n_old, features.n_entities))
+        self.tfidf = vstack([self.tfidf, tfidf_vectors(added.matrix(), self.idf)]).tocsr()
+
+        self._itemset_counts += self._count_itemsets(added)
+        self._added_since_mining += len(movies)
+
+        self._set_frame(pd.concat([self.df, movies], ignore_index=True), features)
+
+        # Neighbor lists of the new movies, then of the old movies they displace
+        tfidf_t = self.tfidf.T.tocsr()
+        self.neighbors = np.concatenate([self.neighbors, np.empty((len(rows), self.top_k), dtype=np.int32)])
+        self.scores = np.concatenate([self.scores, np.empty((len(rows), self.top_k), dtype=np.float32)])
+
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+            self.neighbors[block], self.scores[block] = top_neighbors(self.tfidf, tfidf_t, block, self.top_k)
+
+            cross = (self.tfidf[:n_old] @ self.tfidf[block].T).tocsr()
+            hits = cross.tocoo()
+            displaced = np.unique(hits.row[hits.data > self.scores[hits.row, -1]])
+
+            self._merge_neighbors(displaced, np.broadcast_to(block, (len(displaced), len(block))),
+                                  cross[displaced].toarray().astype(np.float32))
+
+        self._after_update()
+        return rows
+
+    def remove_movies(self, movies):
+        """
+        Remove movies, given as titles or rows; unknown titles are ignored
+
+        Rows after a removed movie move up, as if the catalog had been
+        loaded without it.
+        """
+        rows = np.array([
+            movie if isinstance(movie, (int, np.integer)) else get_title_index(self.df).get(movie, -1)
+            for movie in movies
+        ], dtype=np.int64)
+        rows = np.unique(rows[rows >= 0])
+        if len(rows) == 0:
+            return
+
+        keep = np.ones(len(self.df), dtype=bool)
+        keep[rows] = False
+        kept = np.flatnonzero(keep)
+
+        if len(kept) <= self.top_k:
+            raise ValueError(f"Cannot shrink the catalog to {len(kept)} movies with top_k={self.top_k}")
+
+        removed = self.features.take(rows)
+        self._itemset_counts -= self._count_itemsets(removed)
+        self.document_frequency = self.document_frequency - np.bincount(removed.indices, minlength=len(self.document_frequency))
+
+        self.tfidf = self.tfidf[kept]
+        self._set_frame(self.df.iloc[kept].reset_index(drop=True), self.features.take(kept))
+
+        # Renumber neighbors; lists that lost a neighbor are recomputed
+        new_row = np.cumsum(keep) - 1
+        new_row[~keep] = -1
+        self.neighbors = new_row[self.neighbors[kept]].astype(np.int32)
+        self.scores = self.scores[kept]
+
+        stale = np.flatnonzero((self.neighbors < 0).any(axis=1))
+        tfidf_t = self.tfidf.T.tocsr()
+        for start in range(0, len(stale), self.block_size):
+            block = stale[start:start + self.block_size]
+            self.neighbors[block], self.scores[block] = top_neighbors(self.tfidf, tfidf_t, block, self.top_k)
+
+        self._after_update()
+
+    def idf_drift(self):
+        """
+        Largest distance between a movie's stored TF-IDF vector and the one
+        a rebuild would fit
+
+        Vectors are unit length, so a similarity score is off by at most
+        the drift of its two movies combined.
+        """
+        drift, _ = self._vector_drift(idf_weights(self.document_frequency, len(self.df)))
+        return float(drift.max()) if len(drift) else 0.0
+
+    def refresh_idf(self):
+        """
+        Refit the IDF weights and rebuild the neighbor index under them
+        """
+        self.idf = idf_weights(self.document_frequency, len(self.df))
+        self.tfidf = tfidf_vectors(self.features.matrix(), self.idf)
+
+        index = build_neighbor_index(self.df, top_k=self.top_k, block_size=self.block_size)
+        self.neighbors, self.scores = index.neighbors, index.scores
+
+    def consistency_check(self, sample=200, seed=0):
+        """
+        Compare the model with a full rebuild of the current catalog
+
+        neighbor_recall is the share of neighbors that belong in the
+        rebuilt top-K (ties count as matches), score_error the largest gap
+        between the two sorted score lists of a movie. Rules are compared
+        by antecedent/consequent; recommendation_agreement is the share of
+        sampled movies whose hybrid recommendations come out identical.
+        """
+        # A copy has no cached derived structures, so everything is rebuilt from scratch
+        fresh = self.df.copy()
+        fresh_index = build_neighbor_index(fresh, top_k=self.top_k, block_size=self.block_size)
+        fresh_rules = build_association_rules(
+            fresh, min_support=self.min_support, min_confidence=self.min_confidence,
+            max_len=self.max_len, max_rules=self.max_rules
+        )
+
+        # True similarity of every listed neighbor, from the rebuilt vectors
+        fresh_features = get_feature_store(fresh)
+        fresh_tfidf = tfidf_vectors(
+            fresh_features.matrix(),
+            idf_weights(np.bincount(fresh_features.indices, minlength=fresh_features.n_entities), len(fresh))
+        )
+        rows = np.repeat(np.arange(len(fresh)), self.top_k)
+        true_scores = np.asarray(
+            fresh_tfidf[rows].multiply(fresh_tfidf[self.neighbors.ravel()]).sum(axis=1)
+        ).reshape(self.neighbors.shape)
+        in_top_k = true_scores >= fresh_index.scores[:, -1:] - 1e-6
+
+        own = self._rule_table(self.rules_frame)
+        rebuilt = self._rule_table(fresh_rules)
+        shared = own.keys() & rebuilt.keys()
+
+        sample_rows = np.random.default_rng(seed).choice(len(fresh), min(sample, len(fresh)), replace=False)
+        own_recommendations, _, _ = hybrid_recommend_many(sample_rows, self.df, self.similarity_index, self.rules)
+        fresh_recommendations, _, _ = hybrid_recommend_many(
+            sample_rows, fresh, fresh_index, build_rule_index(fresh_rules, fresh)
+        )
+
+        return {
+            "movies": len(fresh),
+            "idf_drift": self.idf_drift(),
+            "neighbor_recall": float(in_top_k.mean()) if in_top_k.size else 1.0,
+            "score_error": float(np.abs(self.scores - fresh_index.scores).max()) if self.scores.size else 0.0,
+            "rules": len(own),
+            "rebuilt_rules": len(rebuilt),
+            "missing_rules": len(rebuilt.keys() - own.keys()),
+            "extra_rules": len(own.keys() - rebuilt.keys()),
+            "confidence_error": max((abs(own[key] - rebuilt[key]) for key in shared), default=0.0),
+            "recommendation_agreement": float((own_recommendations == fresh_recommendations).all(axis=1).mean()),
+        }
+
+    def _set_frame(self, df, features):
+        self.df = df
+        self.features = features
+        # Register the updated store so get_feature_store(df) doesn't rebuild it
+        get_derived(df, "features", lambda _: features)
+
+    def _merge_neighbors(self, rows, candidates, candidate_scores):
+        """
+        Fold candidate neighbors into the top-K lists of rows
+        """
+        if len(rows) == 0:
+            return
+
+        ids = np.hstack([self.neighbors[rows], candidates])
+        scores = np.hstack([self.scores[rows], candidate_scores])
+
+        top = np.argpartition(-scores, self.top_k - 1, axis=1)[:, :self.top_k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        self.neighbors[rows] = np.take_along_axis(np.take_along_axis(ids, top, axis=1), order, axis=1)
+        self.scores[rows] = np.take_along_axis(top_scores, order, axis=1)
+
+    def _mine_itemsets(self):
+        watch_support = self.min_support * self.watch_ratio
+
+        found = mine_frequent_itemsets(
+            self.features.indptr, self.features.indices, self.features.n_entities,
+            min_support=watch_support, max_len=self.max_len
+        )
+
+        self._itemsets = list(found)
+        self._itemset_counts = np.array(list(found.values()), dtype=np.int64)
+        self._watch_count = support_count(watch_support, len(self.df))
+        self._added_since_mining = 0
+
+    def _count_itemsets(self, features):
+        """
+        Number of movies in features containing each tracked itemset
+        """
+        lengths = [len(itemset) for itemset in self._itemsets]
+        indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        itemsets = csr_matrix(
+            (np.ones(indptr[-1], dtype=np.float32), [item for itemset in self._itemsets for item in itemset], indptr),
+            shape=(len(self._itemsets), features.n_entities)
+        )
+
+        # A movie contains an itemset when it hits all of its items
+        hits = (features.matrix() @ itemsets.T).tocoo()
+        contained = hits.data == np.asarray(lengths, dtype=np.float32)[hits.col]
+
+        return np.bincount(hits.col[contained], minlength=len(self._itemsets))
+
+    def _update_rules(self):
+        min_count = support_count(self.min_support, len(self.df))
+
+        # An untracked itemset had fewer than _watch_count movies when mined
+        # and gained at most one per movie added since
+        if self._watch_count + self._added_since_mining > min_count:
+            self._mine_itemsets()
+
+        frequent = {
+            itemset: int(count)
+            for itemset, count in zip(self._itemsets, self._itemset_counts.tolist())
+            if count >= min_count
+        }
+
+        self.rules_frame = generate_rules(
+            frequent, len(self.df), self.features.labels,
+            min_confidence=self.min_confidence, max_rules=self.max_rules
+        )
+        self.rules = build_rule_index(self.rules_frame, self.df)
+
+    def _after_update(self):
+        self._update_rules()
+
+        if self.idf_tolerance is None:
+            return
+
+        idf = idf_weights(self.document_frequency, len(self.df))
+        drift, fitted = self._vector_drift(idf)
+        drifted = np.flatnonzero(drift > self.idf_tolerance)
+
+        if len(drifted) > self.refresh_ratio * len(self.df):
+            self.refresh_idf()
+        elif len(drifted):
+            self.idf = idf
+            self._refresh_rows(drifted, fitted[drifted])
+
+    def _vector_drift(self, idf):
+        """
+        Distance of every stored TF-IDF row from its vector under idf, and
+        those vectors
+        """
+        fitted = tfidf_vectors(self.features.matrix(), idf)
+        gap = self.tfidf - fitted
+        return np.sqrt(np.asarray(gap.multiply(gap).sum(axis=1)).ravel()), fitted
+
+    def _refresh_rows(self, rows, vectors):
+        """
+        Replace the TF-IDF vectors of rows and repair the neighbor lists
+        they change
+        """
+        n_movies = len(self.df)
+        position = np.arange(n_movies)
+        position[rows] = n_movies + np.arange(len(rows))
+        self.tfidf = vstack([self.tfidf, vectors]).tocsr()[position]
+
+        # Lists of the refreshed rows, and every list holding a stale score of one, start over
+        refreshed = np.zeros(n_movies, dtype=bool)
+        refreshed[rows] = True
+        stale = refreshed | refreshed[self.neighbors].any(axis=1)
+        stale_rows = np.flatnonzero(stale)
+
+        tfidf_t = self.tfidf.T.tocsr()
+        for start in range(0, len(stale_rows), self.block_size):
+            block = stale_rows[start:start + self.block_size]
+            self.neighbors[block], self.scores[block] = top_neighbors(self.tfidf, tfidf_t, block, self.top_k)
+
+        # The remaining lists only take refreshed rows that now score high enough
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+
+            cross = (self.tfidf @ self.tfidf[block].T).tocsr()
+            hits = cross.tocoo()
+            keep = ~stale[hits.row] & (hits.data > self.scores[hits.row, -1])
+            displaced = np.unique(hits.row[keep])
+
+            self._merge_neighbors(displaced, np.broadcast_to(block, (len(displaced), len(block))),
+                                  cross[displaced].toarray().astype(np.float32))
+
+    @staticmethod
+    def _rule_table(rules):
+        return {
+            (antecedent, consequent): confidence
+            for antecedent, consequent, confidence in zip(rules["antecedents"], rules["consequents"], rules["confidence"])
+        }
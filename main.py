@@ -1,18 +1,10 @@
-from ml.preprocessing import load_and_clean_data
-from ml.similarity import build_similarity_matrix
-from ml.association import build_association_rules
+from ml.artifacts import load_or_build_artifacts
 from ml.recommender import hybrid_recommend
 from llm.agent import create_agent
 
 
-print("Loading dataset...")
-df = load_and_clean_data()
-
-print("Building similarity matrix...")
-similarity_matrix = build_similarity_matrix(df)
-
-print("Building association rules...")
-rules = build_association_rules(df)
+print("Loading model artifacts...")
+df, similarity_matrix, rules = load_or_build_artifacts()
 
 print("Initializing AI agent...")
 agent = create_agent(df, similarity_matrix, rules, hybrid_recommend)
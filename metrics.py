@@ -0,0 +1,206 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger("movie_recommender.metrics")
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Registry:
+    """
+    In-process counters, histograms and gauges
+
+    Disabled by default (unless MOVIE_RECOMMENDER_METRICS is set): every
+    call then returns right away, and timer() hands back a shared no-op
+    context manager. With log=True each observation is also written as a
+    JSON line to the "movie_recommender.metrics" logger.
+    """
+
+    def __init__(self, enabled=False, log=False, buckets=BUCKETS):
+        self.enabled = enabled
+        self.log = log
+        self.buckets = tuple(buckets)
+
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def enable(self, log=False):
+        self.enabled = True
+        self.log = log
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            histogram[0][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[1] += seconds
+
+        if self.log:
+            logger.info(json.dumps({"metric": name, "seconds": seconds, **labels}))
+
+    def timer(self, name, **labels):
+        """
+        Context manager observing the seconds spent in its block
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def gauge(self, name, read):
+        """
+        Register a gauge whose value is read() at snapshot time
+        """
+        self._gauges[name] = read
+
+    def counter_value(self, name, **labels):
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def hit_ratio(self, name):
+        """
+        Share of the counts of counter name labelled result="hit"
+        """
+        with self._lock:
+            counts = [(labels, value) for (counter, labels), value in self._counters.items() if counter == name]
+
+        total = sum(value for _, value in counts)
+        hits = sum(value for labels, value in counts if ("result", "hit") in labels)
+        return hits / total if total else 0.0
+
+    def snapshot(self):
+        """
+        Current values as plain data: counters, histograms and gauges
+        """
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "buckets": dict(zip([*map(str, self.buckets), "+Inf"], counts)),
+                    "count": sum(counts),
+                    "sum": total,
+                }
+                for (name, labels), (counts, total) in sorted(self._histograms.items())
+            ]
+
+        gauges = [{"name": name, "value": read()} for name, read in sorted(self._gauges.items())]
+
+        return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+    def prometheus_text(self):
+        """
+        Snapshot in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for counter in snapshot["counters"]:
+            declare(counter["name"], "counter")
+            lines.append(f"{counter['name']}{_labels(counter['labels'])} {counter['value']}")
+
+        for histogram in snapshot["histograms"]:
+            name, labels = histogram["name"], histogram["labels"]
+            declare(name, "histogram")
+
+            cumulative = 0
+            for bound, count in histogram["buckets"].items():
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+
+        for gauge in snapshot["gauges"]:
+            declare(gauge["name"], "gauge")
+            lines.append(f"{gauge['name']} {gauge['value']}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = Registry(enabled=os.environ.get("MOVIE_RECOMMENDER_METRICS", "") not in ("", "0"))
+
+timer = REGISTRY.timer
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+
+
+def enable_metrics(log=False):
+    REGISTRY.enable(log=log)
+
+
+def prometheus_snapshot():
+    return REGISTRY.prometheus_text()
+
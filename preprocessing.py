@@ -1,22 +1,45 @@
 import pandas as pd
 import ast
 import os
+import weakref
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+    _json_loads = json.loads
 
-def load_and_clean_data():
+
+# Structures derived from a loaded frame (title index, features, ...), keyed by id(df)
+_derived = {}
+
+
+def get_data_paths(data_dir=None):
     """
-    Load and clean the TMDB 5000 movies dataset
+    Return the (movies, credits) CSV paths inside data_dir
     """
-    # Get the directory where this file is located (ml directory)
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    # Go up one level to movie_recommender directory
-    movie_recommender_dir = os.path.dirname(current_dir)
-    # Data is in movie_recommender/data
-    data_dir = os.path.join(movie_recommender_dir, 'data')
+    if data_dir is None:
+        # Get the directory where this file is located (ml directory)
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        # Go up one level to movie_recommender directory
+        movie_recommender_dir = os.path.dirname(current_dir)
+        # Data is in movie_recommender/data
+        data_dir = os.path.join(movie_recommender_dir, 'data')
     
     movies_path = os.path.join(data_dir, 'tmdb_5000_movies.csv')
     credits_path = os.path.join(data_dir, 'tmdb_5000_credits.csv')
     
+    return movies_path, credits_path
+
+
+def load_and_clean_data(data_dir=None):
+    """
+    Load and clean the TMDB 5000 movies dataset
+    """
+    movies_path, credits_path = get_data_paths(data_dir)
+    data_dir = os.path.dirname(movies_path)
+    
     # Check if files exist
     if not os.path.exists(movies_path):
         raise FileNotFoundError(f"Movies file not found at: {movies_path}")
@@ -25,36 +48,99 @@ def load_and_clean_data():
     
     print(f"Loading data from: {data_dir}")
     
-    # Load datasets
-    movies = pd.read_csv(movies_path)
-    credits = pd.read_csv(credits_path)
+    # Load datasets, reading only the columns we use
+    movies = pd.read_csv(movies_path, usecols=['id', 'title', 'genres', 'vote_average', 'popularity'])
+    credits = pd.read_csv(credits_path, usecols=['movie_id', 'cast'])
     
-    # Merge datasets
-    df = movies.merge(credits, on='title')
+    stats = {
+        'movies': len(movies),
+        'credits': len(credits),
+        'duplicate_movie_ids': int(movies.duplicated(subset='id').sum()),
+        'duplicate_credit_ids': int(credits.duplicated(subset='movie_id').sum()),
+    }
     
-    # Parse JSON-like strings
-    df['genres'] = df['genres'].apply(safe_parse)
-    df['cast'] = df['cast'].apply(safe_parse)
+    # One row per TMDB id on each side, so the join below is one-to-one
+    movies = movies.drop_duplicates(subset='id')
+    credits = credits.drop_duplicates(subset='movie_id')
     
-    # Extract names from parsed data
-    df['genres'] = df['genres'].apply(lambda x: [i['name'] for i in x] if isinstance(x, list) else [])
-    df['cast'] = df['cast'].apply(lambda x: [i['name'] for i in x[:5]] if isinstance(x, list) else [])
+    stats['orphan_movies'] = int((~movies['id'].isin(credits['movie_id'])).sum())
+    stats['orphan_credits'] = int((~credits['movie_id'].isin(movies['id'])).sum())
     
-    # Keep only necessary columns
-    df = df[['title', 'genres', 'cast', 'vote_average', 'popularity']]
+    # Merge datasets on the TMDB id; titles are not unique (remakes, re-releases)
+    df = movies.merge(credits, left_on='id', right_on='movie_id', validate='one_to_one')
     
-    # Remove duplicates
-    df = df.drop_duplicates(subset='title')
+    # Remove duplicate titles before parsing; rows are addressed by position from here on
+    stats['duplicate_titles'] = int(df.duplicated(subset='title').sum())
+    df = df.drop_duplicates(subset='title').reset_index(drop=True)
     
-    # Create combined column for similarity calculation
-    # Combine genres and cast into a single string
-    df['combined'] = df['genres'].apply(lambda x: ' '.join(x)) + ' ' + df['cast'].apply(lambda x: ' '.join(x))
+    # Parse the JSON columns, keeping only the names
+    df['genres'] = parse_names(df['genres'])
+    df['cast'] = parse_names(df['cast'], limit=5)
+    
+    # Keep only necessary columns; the models read genres and cast through
+    # the integer-encoded feature store (ml/features.py)
+    df = df[['title', 'genres', 'cast', 'vote_average', 'popularity']].copy()
+    
+    stats['loaded'] = len(df)
+    df.attrs['load_stats'] = stats
     
     print(f"Loaded {len(df)} movies")
+    print(
+        f"Skipped {stats['duplicate_movie_ids'] + stats['duplicate_credit_ids']} duplicate ids, "
+        f"{stats['orphan_movies']} movies without credits, "
+        f"{stats['orphan_credits']} credits without movies, "
+        f"{stats['duplicate_titles']} duplicate titles"
+    )
+    
+    # Build lookup structures once, at load time
+    from ml.title_index import get_title_index, get_title_resolver
+    from ml.features import get_feature_store
+    get_title_index(df)
+    get_title_resolver(df)
+    get_feature_store(df)
     
     return df
 
 
+def get_derived(df, name, build):
+    """
+    Return build(df), computed once per frame and cached until df is freed
+    """
+    key = id(df)
+    entry = _derived.get(key)
+    
+    if entry is None:
+        entry = _derived[key] = {}
+        weakref.finalize(df, _derived.pop, key, None)
+    
+    if name not in entry:
+        entry[name] = build(df)
+    
+    return entry[name]
+
+
+def parse_names(values, limit=None):
+    """
+    Extract the 'name' of each entry from a column of JSON-encoded lists,
+    keeping at most limit names per row
+    """
+    names = []
+    
+    for value in values:
+        try:
+            parsed = _json_loads(value)
+        except (ValueError, TypeError):
+            # Not strict JSON (or missing); fall back to the Python literal parser
+            parsed = safe_parse(value)
+        
+        if isinstance(parsed, list):
+            names.append([item['name'] for item in parsed[:limit]])
+        else:
+            names.append([])
+    
+    return names
+
+
 def safe_parse(x):
     """
     Safely parse JSON-like strings
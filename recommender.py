@@ -1,21 +1,382 @@
 import numpy as np
+from ml.similarity import NeighborIndex, get_tfidf_matrix
+from ml.association import RuleIndex, build_rule_index, _ranges
+from ml.title_index import get_title_index
+from ml.features import get_feature_store
+from ml.catalog import get_catalog_index
+from ml.preprocessing import get_derived
+from ml import metrics
 
 
-def hybrid_recommend(movie_name, df, similarity_matrix, rules, top_n=4):
-    if movie_name not in df["title"].values:
+# Number of most similar movies re-ranked for every query
+CANDIDATES = 19
+
+# Bytes one pass over full similarity rows may hold: the scores plus
+# argpartition's int64 positions, up to 16 bytes per movie per query row
+DENSE_BLOCK_BYTES = 128 << 20
+
+
+def hybrid_recommend(movie_name, df, similarity_matrix, rules, top_n=4, genre=None, min_rating=None,
+                     min_popularity=None):
+    """
+    Up to top_n titles similar to movie_name
+
+    genre, min_rating and min_popularity restrict the recommendations;
+    they are applied before candidate selection, so the result still holds
+    top_n titles whenever that many movies pass the filters.
+    """
+    with metrics.timer("recommend_stage_seconds", stage="title_lookup"):
+        idx = get_title_index(df).get(movie_name)
+
+    if idx is None:
+        metrics.inc("recommend_requests_total", result="not_found")
         return ["Movie not found in dataset"]
 
-    idx = df[df["title"] == movie_name].index[0]
+    metrics.inc("recommend_requests_total", result="found")
 
-    # --- 1️⃣ Similarity Scores ---
-    sim_scores = list(enumerate(similarity_matrix[idx]))
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)[1:20]
+    mask = _filter_mask(df, genre, min_rating, min_popularity)
+    indices, _ = _recommend_rows(np.array([idx]), df, similarity_matrix, rules, top_n, mask)
+
+    titles = get_title_index(df).titles
+    return [titles[i] for i in indices[0].tolist() if i >= 0]
+
+
+def hybrid_recommend_many(movies, df, similarity_matrix, rules, top_n=4, block_size=1024, genre=None,
+                          min_rating=None, min_popularity=None):
+    """
+    Recommend for many movies at once
+
+    Args:
+        movies: Titles or positional row ids
+        top_n: Recommendations per movie
+        block_size: Queries scored together in one vectorized pass; full
+            similarity rows are split further to stay under DENSE_BLOCK_BYTES
+        genre, min_rating, min_popularity: Filters, as in hybrid_recommend
+
+    Returns:
+        (indices, scores, titles), each of shape (len(movies), top_n).
+        Rows for unknown movies, and slots beyond the available candidates,
+        hold -1 / NaN / None.
+    """
+    with metrics.timer("recommend_stage_seconds", stage="title_lookup"):
+        rows = _resolve_rows(movies, df)
+
+    metrics.inc("recommend_requests_total", int((rows >= 0).sum()), result="found")
+    metrics.inc("recommend_requests_total", int((rows < 0).sum()), result="not_found")
+
+    indices = np.full((len(rows), top_n), -1, dtype=np.int64)
+    scores = np.full((len(rows), top_n), np.nan)
+
+    found = np.flatnonzero(rows >= 0)
+    mask = _filter_mask(df, genre, min_rating, min_popularity)
+
+    for start in range(0, len(found), block_size):
+        block = found[start:start + block_size]
+
+        block_indices, block_scores = _recommend_rows(rows[block], df, similarity_matrix, rules, top_n, mask)
+
+        indices[block, :block_indices.shape[1]] = block_indices
+        scores[block, :block_scores.shape[1]] = block_scores
+
+    scores[indices < 0] = np.nan
+
+    titles = np.where(indices >= 0, get_title_index(df).title_array[indices], None)
+
+    return indices, scores, titles
+
+
+def profile_recommend(seeds, df, similarity_matrix, rules, weights=None, top_n=10, exclude=None, genre=None,
+                      min_rating=None, min_popularity=None):
+    """
+    Recommend for a whole watch history in one pass
+
+    Args:
+        seeds: Titles or positional row ids the user has watched
+        weights: Optional weight per seed (e.g. the user's ratings); equal by default
+        top_n: Recommendations to return
+        exclude: Further titles or rows to leave out; the seeds always are
+        genre, min_rating, min_popularity: Filters, as in hybrid_recommend
+
+    Every seed contributes its nearest neighbors, and each candidate scores
+    0.7 * similarity + 0.3 * boost as in hybrid_recommend, with similarity
+    the weighted mean over seeds (0 for seeds it is not a neighbor of) and
+    boost the candidate's strongest token in the weighted mean of the
+    seeds' rule boosts. A single seed ranks like hybrid_recommend. With a
+    NeighborIndex the cost grows with the number of neighbors gathered,
+    not with the catalog.
 
-    final_scores = {}
+    Returns:
+        (indices, scores, titles) of up to top_n movies, best first.
+        Unknown seeds are ignored.
+    """
+    with metrics.timer("recommend_stage_seconds", stage="title_lookup"):
+        rows = _resolve_rows(seeds, df)
 
-    movie_features = set(df.iloc[idx]["combined"].split())
+    weights = np.ones(len(rows)) if weights is None else np.asarray(weights, dtype=np.float64)
+    if weights.shape != rows.shape:
+        raise ValueError("Expected one weight per seed")
+
+    known = rows >= 0
+    rows, weights = rows[known], weights[known]
+
+    if len(rows) == 0 or weights.sum() <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.array([], dtype=object)
+
+    weights = weights / weights.sum()
+    mask = _filter_mask(df, genre, min_rating, min_popularity)
+
+    seen = rows if exclude is None else np.concatenate([rows, _resolve_rows(exclude, df)])
+
+    with metrics.timer("recommend_stage_seconds", stage="similarity"):
+        movies, similarity = _profile_similarity(similarity_matrix, rows, weights, mask, df)
+
+        keep = ~np.isin(movies, seen)
+        movies, similarity = movies[keep], similarity[keep]
+
+    with metrics.timer("recommend_stage_seconds", stage="rule_boost"):
+        if not isinstance(rules, RuleIndex):
+            rules = build_rule_index(rules, df)
+        boosts = rules.candidate_boosts(weights @ rules.boost_matrix(rows), movies)
+
+    with metrics.timer("recommend_stage_seconds", stage="rank"):
+        scores = (0.7 * similarity) + (0.3 * boosts)
+
+        k = min(top_n, len(movies))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), np.array([], dtype=object)
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((movies[top], -scores[top]))]
+
+    return movies[top], scores[top], get_title_index(df).title_array[movies[top]]
+
+
+def _resolve_rows(movies, df):
+    movies = np.asarray(movies)
+
+    if np.issubdtype(movies.dtype, np.integer):
+        return np.where((movies >= 0) & (movies < len(df)), movies, -1).astype(np.int64)
+
+    return get_title_index(df).rows_of(movies)
+
+
+def _filter_mask(df, genre, min_rating, min_popularity):
+    if genre is None and min_rating is None and min_popularity is None:
+        return None
+    return get_catalog_index(df).mask(genre, min_rating, min_popularity)
+
+
+def _recommend_rows(rows, df, similarity_matrix, rules, top_n, mask=None):
+    """
+    Score and rank the candidates of each row in rows, among the movies
+    mask allows
+
+    Returns (indices, scores) arrays of shape (len(rows), min(top_n, candidates)).
+    Slots with no movie left hold -1 / -inf.
+    """
+    # --- 1️⃣ Similarity Scores ---
+    with metrics.timer("recommend_stage_seconds", stage="similarity"):
+        candidates, sim_scores = _top_candidates(similarity_matrix, rows, CANDIDATES, mask, df)
+
+    valid = candidates >= 0
+    lookup = np.where(valid, candidates, 0)
 
     # --- 2️⃣ Association Boost ---
+    with metrics.timer("recommend_stage_seconds", stage="rule_boost"):
+        if isinstance(rules, RuleIndex):
+            boosts = rules.candidate_boosts(rules.boost_matrix(rows), lookup)
+        else:
+            boosts = np.array([
+                _scan_rule_boosts(idx, movie_candidates, df, rules)
+                for idx, movie_candidates in zip(rows, lookup)
+            ], dtype=np.float64).reshape(candidates.shape)
+        boosts[~valid] = 0
+
+    # --- 3️⃣ Combine Scores ---
+    with metrics.timer("recommend_stage_seconds", stage="rank"):
+        final_scores = (0.7 * sim_scores) + (0.3 * boosts)
+
+        order = np.argsort(-final_scores, axis=1, kind="stable")[:, :top_n]
+
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(final_scores, order, axis=1)
+
+
+def _top_candidates(similarity_matrix, rows, k, mask=None, df=None):
+    """
+    The k most similar movies to each row, excluding the row itself,
+    as (candidates, scores) sorted by descending similarity
+
+    With a boolean mask, only movies it allows are candidates; slots
+    beyond the movies found hold -1 / -inf. A NeighborIndex answers from
+    its stored lists while they hold at least k allowed movies, so both
+    kinds of index select the same candidates.
+    """
+    if isinstance(similarity_matrix, NeighborIndex):
+        if mask is not None:
+            return _filtered_neighbors(similarity_matrix, rows, k, mask, df)
+
+        k = min(k, similarity_matrix.top_k)
+        return (
+            np.asarray(similarity_matrix.neighbors[rows, :k], dtype=np.int64),
+            np.asarray(similarity_matrix.scores[rows, :k], dtype=np.float64)
+        )
+
+    # Keep the dense pass under DENSE_BLOCK_BYTES whatever the batch size
+    n_movies = similarity_matrix.shape[1]
+    step = max(1, DENSE_BLOCK_BYTES // (16 * n_movies))
+    if len(rows) > step:
+        blocks = [_top_candidates(similarity_matrix, rows[start:start + step], k, mask, df)
+                  for start in range(0, len(rows), step)]
+        return np.vstack([c for c, _ in blocks]), np.vstack([s for _, s in blocks])
+
+    # Scores stay in the index's dtype (float32 for embeddings) and are
+    # negated in place, so argpartition needs no second copy of the block
+    block = np.asarray(similarity_matrix[rows])
+    np.negative(block, out=block)
+    block[np.arange(len(rows)), rows] = np.inf
+
+    if mask is not None:
+        block[:, ~mask] = np.inf
+
+    k = min(k, block.shape[1] - 1)
+    if k <= 0:
+        return np.zeros((len(rows), 0), dtype=np.int64), np.zeros((len(rows), 0))
+
+    top = np.argpartition(block, k - 1, axis=1)[:, :k]
+    top_scores = -np.take_along_axis(block, top, axis=1).astype(np.float64)
+
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    top[top_scores == -np.inf] = -1
+    return top, top_scores
+
+
+def _filtered_neighbors(similarity_index, rows, k, mask, df):
+    """
+    The k best allowed neighbors of each row
+
+    The first allowed movies of each stored neighbor list are exact, since
+    the list is sorted. Rows whose list holds fewer than k of them are
+    rescored against the allowed movies with the TF-IDF vectors, so the
+    re-ranked pool never shrinks below k while enough movies pass.
+    """
+    neighbors = np.asarray(similarity_index.neighbors[rows], dtype=np.int64)
+    scores = np.asarray(similarity_index.scores[rows], dtype=np.float64)
+    allowed = (neighbors >= 0) & mask[np.maximum(neighbors, 0)]
+
+    # Allowed neighbors first, keeping their order
+    first = np.argsort(~allowed, axis=1, kind="stable")[:, :k]
+    kept = np.take_along_axis(allowed, first, axis=1)
+
+    candidates = np.full((len(rows), k), -1, dtype=np.int64)
+    candidate_scores = np.full((len(rows), k), -np.inf)
+    candidates[:, :first.shape[1]] = np.where(kept, np.take_along_axis(neighbors, first, axis=1), -1)
+    candidate_scores[:, :first.shape[1]] = np.where(kept, np.take_along_axis(scores, first, axis=1), -np.inf)
+
+    short = np.flatnonzero(allowed.sum(axis=1) < k)
+    if len(short):
+        _rescore_allowed(df, np.asarray(rows)[short], mask, candidates, candidate_scores, short)
+
+    return candidates, candidate_scores
+
+
+def _rescore_allowed(df, rows, mask, candidates, candidate_scores, slots, block_size=64):
+    """
+    Exact top candidates of rows among the movies mask allows, written to
+    candidates / candidate_scores at slots
+
+    Only the allowed movies are scored, so the cost follows the size of
+    the filter rather than the catalog; narrow filters are the ones whose
+    stored neighbor lists run short.
+    """
+    tfidf_matrix = get_tfidf_matrix(df)
+    allowed_rows, allowed_t = _allowed_tfidf(df, mask)
+    k = min(candidates.shape[1], len(allowed_rows))
+    if k == 0:
+        return
+
+    for start in range(0, len(rows), block_size):
+        queries = rows[start:start + block_size]
+
+        # Cosine against each allowed movie: walk the query's entities
+        # through the allowed movies' postings and sum the products
+        starts = tfidf_matrix.indptr[queries]
+        lengths = tfidf_matrix.indptr[queries + 1] - starts
+        entries = _ranges(starts, lengths)
+        entities = tfidf_matrix.indices[entries]
+
+        posting_starts = allowed_t.indptr[entities]
+        posting_lengths = allowed_t.indptr[entities + 1] - posting_starts
+        postings = _ranges(posting_starts, posting_lengths)
+
+        query_of = np.repeat(np.repeat(np.arange(len(queries)), lengths), posting_lengths)
+        block = np.bincount(
+            query_of * len(allowed_rows) + allowed_t.indices[postings],
+            weights=np.repeat(tfidf_matrix.data[entries], posting_lengths) * allowed_t.data[postings],
+            minlength=len(queries) * len(allowed_rows)
+        ).astype(np.float64).reshape(len(queries), len(allowed_rows))
+
+        # A movie is never its own neighbor
+        positions = np.minimum(np.searchsorted(allowed_rows, queries), len(allowed_rows) - 1)
+        is_allowed = allowed_rows[positions] == queries
+        block[np.flatnonzero(is_allowed), positions[is_allowed]] = -np.inf
+
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+        out = slots[start:start + block_size]
+        candidates[out], candidate_scores[out] = -1, -np.inf
+        candidates[out, :k] = np.where(top_scores == -np.inf, -1, allowed_rows[top])
+        candidate_scores[out, :k] = top_scores
+
+
+def _allowed_tfidf(df, mask):
+    """
+    (allowed rows, their TF-IDF vectors transposed) for a filter mask,
+    kept for as long as the mask itself
+    """
+    def build(mask):
+        allowed_rows = np.flatnonzero(mask)
+        return allowed_rows, get_tfidf_matrix(df)[allowed_rows].T.tocsr()
+
+    return get_derived(mask, "allowed_tfidf", build)
+
+
+def _profile_similarity(similarity_matrix, rows, weights, mask, df, block_size=256):
+    """
+    Weighted similarity of every candidate to the seeds, summed over the
+    seeds it neighbors, as (movies, similarity)
+
+    Seeds are gathered a block at a time for the similarity indexes that
+    materialize a full row per seed.
+    """
+    if isinstance(similarity_matrix, NeighborIndex):
+        candidates, sim_scores = _top_candidates(similarity_matrix, rows, CANDIDATES, mask, df)
+    else:
+        blocks = [_top_candidates(similarity_matrix, rows[start:start + block_size], CANDIDATES, mask, df)
+                  for start in range(0, len(rows), block_size)]
+        candidates, sim_scores = np.vstack([c for c, _ in blocks]), np.vstack([s for _, s in blocks])
+
+    valid = candidates >= 0
+    movies, inverse = np.unique(candidates[valid], return_inverse=True)
+    similarity = np.bincount(
+        inverse, weights=np.broadcast_to(weights[:, None], candidates.shape)[valid] * sim_scores[valid],
+        minlength=len(movies)
+    )
+
+    return movies, similarity
+
+
+def _scan_rule_boosts(idx, candidates, df, rules):
+    """
+    Association boosts computed straight from a rules frame
+    """
+    features = get_feature_store(df)
+    movie_features = set(features.entity_labels(idx))
+
     boost_dict = {}
 
     for _, row in rules.iterrows():
@@ -23,26 +384,17 @@ def hybrid_recommend(movie_name, df, similarity_matrix, rules, top_n=4):
             for consequent in row["consequents"]:
                 boost_dict[consequent] = row["confidence"]
 
-    # --- 3️⃣ Combine Scores ---
-    for i, sim_score in sim_scores:
-        title = df.iloc[i]["title"]
+    boosts = []
 
+    for i in candidates:
         boost = 0
-        movie_tokens = set(df.iloc[i]["combined"].split())
+        movie_tokens = set(features.entity_labels(i))
 
-        # If recommended movie shares boosted token
+        # If recommended movie shares boosted tokens, take the strongest
         for token in movie_tokens:
             if token in boost_dict:
-                boost = boost_dict[token]
-
-        final_score = (0.7 * sim_score) + (0.3 * boost)
+                boost = max(boost, boost_dict[token])
 
-        final_scores[title] = final_score
-
-    recommended = sorted(
-        final_scores.items(),
-        key=lambda x: x[1],
-        reverse=True
-    )
+        boosts.append(boost)
 
-    return [movie[0] for movie in recommended[:top_n]]
\ No newline at end of file
+    return boosts
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from ml import metrics
+
+
+metrics.REGISTRY.gauge(
+    "llm_cache_hit_ratio", lambda: metrics.REGISTRY.hit_ratio("llm_cache_requests_total")
+)
+
+
+def normalize_prompt(text):
+    """
+    Case and whitespace insensitive form of a user message
+    """
+    return " ".join(str(text).split()).casefold()
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache with TTL expiry for deterministic LLM chain outputs
+
+    Entries live in memory by default. With a path, they are kept in a
+    SQLite file instead, so every worker process on the host shares them.
+    A hit there only notes the access time in memory; the times are written
+    with the next set() or every ACCESS_BATCH hits, so reads don't turn
+    into writes that serialize the workers. Eviction order is therefore
+    approximately LRU.
+    """
+
+    ACCESS_BATCH = 256
+
+    def __init__(self, max_size=1024, ttl=24 * 3600, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._accessed = {}
+        self._db = None
+
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+
+        with self._lock:
+            if self._db is None:
+                value = self._get_memory(key, now)
+            else:
+                value = self._get_sqlite(key, now)
+
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        metrics.inc("llm_cache_requests_total", result="miss" if value is None else "hit")
+        return value
+
+    def set(self, key, value):
+        now = time.time()
+
+        with self._lock:
+            if self._db is None:
+                self._entries[key] = (value, now)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            else:
+                self._accessed.pop(key, None)
+                self._write_accessed()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_size,)
+                )
+                self._db.commit()
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._accessed.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
+
+    def _get_memory(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        value, created = entry
+        if now - created > self.ttl:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def _get_sqlite(self, key, now):
+        row = self._db.execute(
+            "SELECT value, created FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        value, created = row
+        if now - created > self.ttl:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+
+        self._accessed[key] = now
+        if len(self._accessed) >= self.ACCESS_BATCH:
+            self._write_accessed()
+            self._db.commit()
+        return value
+
+    def _write_accessed(self):
+        """
+        Write out the access times noted since the last batch, uncommitted
+        """
+        if self._accessed:
+            self._db.executemany(
+                "UPDATE responses SET accessed = MAX(accessed, ?) WHERE key = ?",
+                [(accessed, key) for key, accessed in self._accessed.items()]
+            )
+            self._accessed.clear()
@@ -0,0 +1,188 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+
+# Frequent itemset and association rule mining over sparse integer
+# transactions, Eclat-style: every frequent item keeps its transaction set
+# as a packed bitset, itemsets grow depth-first by AND-ing bitsets, and
+# support is a popcount. Nothing proportional to movies x items is allocated.
+
+
+# Set bits per byte value, for popcounts on packed bitsets
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+# Per-process search state for pool workers: (bitsets, min_count, max_len)
+_worker_state = None
+
+
+def _popcount(bits):
+    return int(_POPCOUNT[bits].sum())
+
+
+def support_count(min_support, n_transactions):
+    """
+    Fewest transactions an itemset needs for support >= min_support
+    """
+    return max(1, math.ceil(min_support * n_transactions - 1e-9))
+
+
+def _item_bitsets(indptr, indices, items, n_items):
+    """
+    Packed bitset of the transactions containing each of items
+    """
+    n_transactions = len(indptr) - 1
+    bitsets = np.zeros((len(items), math.ceil(n_transactions / 8)), dtype=np.uint8)
+
+    position = np.full(n_items, -1, dtype=np.int64)
+    position[items] = np.arange(len(items))
+
+    rows = np.repeat(np.arange(n_transactions), np.diff(indptr))
+    columns = position[indices]
+    keep = columns >= 0
+
+    rows, columns = rows[keep], columns[keep]
+    np.bitwise_or.at(bitsets, (columns, rows // 8), (1 << (7 - rows % 8)).astype(np.uint8))
+
+    return bitsets
+
+
+def _grow(itemset, bits, count, later, min_count, max_len, out):
+    """
+    Record itemset, then extend it depth-first with the later items
+    (position, bitset) that are frequent together with its prefix
+    """
+    out[itemset] = count
+
+    if max_len is not None and len(itemset) >= max_len:
+        return
+
+    extensions = []
+    for other, other_bits in later:
+        joint = bits & other_bits
+        joint_count = _popcount(joint)
+        if joint_count >= min_count:
+            extensions.append((other, joint, joint_count))
+
+    for i, (other, joint, joint_count) in enumerate(extensions):
+        _grow(
+            itemset + (other,), joint, joint_count,
+            [(item, item_bits) for item, item_bits, _ in extensions[i + 1:]],
+            min_count, max_len, out
+        )
+
+
+def _mine_prefix(first):
+    """
+    All frequent itemsets whose smallest item position is first
+    """
+    bitsets, min_count, max_len = _worker_state
+    out = {}
+
+    later = [(other, bitsets[other]) for other in range(first + 1, len(bitsets))]
+    _grow((first,), bitsets[first], _popcount(bitsets[first]), later, min_count, max_len, out)
+
+    return out
+
+
+def _init_worker(state):
+    global _worker_state
+    _worker_state = state
+
+
+def mine_frequent_itemsets(indptr, indices, n_items, min_support=0.02, max_len=None, n_jobs=1):
+    """
+    Frequent itemsets of CSR transactions (transaction i holds the item ids
+    indices[indptr[i]:indptr[i + 1]])
+
+    Returns {tuple of item ids: transaction count}, tuples sorted ascending.
+    n_jobs > 1 spreads the search over processes, one first item at a time;
+    n_jobs=-1 uses every core.
+    """
+    n_transactions = len(indptr) - 1
+    if n_transactions == 0:
+        return {}
+
+    # Same threshold as apriori: support >= min_support
+    min_count = support_count(min_support, n_transactions)
+
+    counts = np.bincount(indices, minlength=n_items)
+    items = np.flatnonzero(counts >= min_count)
+
+    bitsets = _item_bitsets(indptr, indices, items, n_items)
+    state = (bitsets, min_count, max_len)
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+
+    found = {}
+    if n_jobs > 1 and len(items) > 1:
+        with ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=(state,)) as pool:
+            for part in pool.map(_mine_prefix, range(len(items))):
+                found.update(part)
+    else:
+        _init_worker(state)
+        for first in range(len(items)):
+            found.update(_mine_prefix(first))
+
+    # Map bitset positions back to item ids
+    return {tuple(int(items[i]) for i in itemset): count for itemset, count in found.items()}
+
+
+def generate_rules(itemsets, n_transactions, names, min_confidence=0.3, max_rules=None):
+    """
+    Association rules from frequent itemsets, in the layout of
+    mlxtend.frequent_patterns.association_rules
+
+    Rules are ordered by itemset size, then item names, then antecedent
+    size from largest to smallest; item ids never affect the order, so
+    the same catalog gives the same rules however it was encoded. With
+    max_rules, only the most confident rules are kept (in that same order).
+    """
+    antecedents, consequents = [], []
+    antecedent_support, consequent_support, support = [], [], []
+
+    by_name = {}
+    for itemset in itemsets:
+        if len(itemset) >= 2:
+            by_name[tuple(sorted(names[i] for i in itemset))] = tuple(sorted(itemset, key=names.__getitem__))
+
+    for key in sorted(by_name, key=lambda x: (len(x), x)):
+        itemset = by_name[key]
+        count = itemsets[tuple(sorted(itemset))]
+
+        for size in range(len(itemset) - 1, 0, -1):
+            for antecedent in combinations(itemset, size):
+                antecedent = tuple(sorted(antecedent))
+                # The same float expression as the confidence column below,
+                # so a rule at exactly min_confidence is kept or dropped alike
+                if (count / n_transactions) / (itemsets[antecedent] / n_transactions) < min_confidence:
+                    continue
+
+                consequent = tuple(sorted(item for item in itemset if item not in antecedent))
+
+                antecedents.append(frozenset(names[i] for i in antecedent))
+                consequents.append(frozenset(names[i] for i in consequent))
+                antecedent_support.append(itemsets[antecedent] / n_transactions)
+                consequent_support.append(itemsets[consequent] / n_transactions)
+                support.append(count / n_transactions)
+
+    rules = pd.DataFrame({
+        "antecedents": antecedents,
+        "consequents": consequents,
+        "antecedent support": np.array(antecedent_support, dtype=np.float64),
+        "consequent support": np.array(consequent_support, dtype=np.float64),
+        "support": np.array(support, dtype=np.float64),
+    })
+    rules["confidence"] = rules["support"] / rules["antecedent support"]
+    rules["lift"] = rules["confidence"] / rules["consequent support"]
+
+    if max_rules is not None and len(rules) > max_rules:
+        keep = rules["confidence"].sort_values(ascending=False, kind="stable").index[:max_rules]
+        rules = rules.loc[sorted(keep)].reset_index(drop=True)
+
+    return rules
@@ -0,0 +1,343 @@
+"""
+HTTP recommendation service
+
+    python server.py --workers 4 --port 8000
+    uvicorn server:app_from_env --factory --workers 4
+
+Endpoints, JSON in and JSON out:
+
+    POST /recommend          {"movie": "Inception", "top_n": 4, "genre": "Comedy", "min_rating": 7}
+    POST /recommend/batch    {"movies": ["Inception", "Avatar"], "top_n": 4}
+    POST /recommend/profile  {"movies": ["Inception", "Avatar"], "weights": [5, 3], "top_n": 10}
+    POST /agent              {"message": "something like Inception"}
+    GET  /health
+    GET  /metrics            Prometheus text for the worker that answers
+
+The /recommend endpoints also accept the optional filters "genre",
+"min_rating" and "min_popularity".
+
+The artifacts are built once before the workers start. Every worker then
+memory-maps the same .npy files read-only, so N workers share one copy of
+the neighbor, rule, feature and title-resolver arrays in the page cache.
+The movies frame is not shared: each worker unpickles its own copy of
+movies.pkl, since its title, genre and cast columns are Python objects.
+"""
+import argparse
+import asyncio
+import json
+import os
+
+from ml.artifacts import ensure_artifacts, load_artifacts, get_artifact_dir
+from ml.recommender import hybrid_recommend, hybrid_recommend_many, profile_recommend
+from ml.catalog import get_catalog_index
+from ml.title_index import get_title_index
+from ml import metrics
+from llm.agent import create_async_simple_agent
+from llm.response_cache import ResponseCache
+
+
+MAX_BODY_BYTES = 1 << 20
+MAX_BATCH = 1024
+MAX_TOP_N = 50
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def create_app(artifact_dir=None, data_dir=None, llm=None, model="llama3.2", request_timeout=10.0,
+               agent_timeout=8.0, max_concurrency=4):
+    """
+    ASGI application serving the recommender and the agent
+
+    The model loads at lifespan startup, once per worker process. A
+    request running past request_timeout seconds gets a 504; the agent
+    falls back to its LLM-free reply after agent_timeout seconds, so keep
+    that the smaller of the two.
+    """
+    state = {}
+
+    def startup():
+        artifact_path = ensure_artifacts(artifact_dir, data_dir)
+        df, similarity_index, rules = load_artifacts(artifact_path)
+
+        # On-disk cache so every worker shares LLM responses
+        cache = ResponseCache(path=os.path.join(artifact_dir or get_artifact_dir(), 'llm_cache.sqlite'))
+
+        state.update(
+            df=df,
+            similarity_index=similarity_index,
+            rules=rules,
+            agent=create_async_simple_agent(
+                df, similarity_index, rules, hybrid_recommend, llm=llm, model=model, cache=cache,
+                max_concurrency=max_concurrency, timeout=agent_timeout
+            ),
+        )
+
+    async def health(receive):
+        return {"status": "ok", "movies": len(state["df"])}
+
+    async def prometheus(receive):
+        return metrics.prometheus_snapshot()
+
+    async def recommend(receive):
+        body = await _read_json(receive)
+        movie = _field(body, "movie", str)
+        top_n = _top_n(body)
+        filters = _filters(body, state["df"])
+
+        movies = await asyncio.to_thread(
+            hybrid_recommend, movie, state["df"], state["similarity_index"], state["rules"], top_n, **filters
+        )
+
+        if movies == ["Movie not found in dataset"]:
+            raise HTTPError(404, f"Movie not found: {movie}")
+
+        return {"movie": movie, "recommendations": movies}
+
+    async def recommend_batch(receive):
+        body = await _read_json(receive)
+        movies = _titles(body, "movies")
+        top_n = _top_n(body)
+        filters = _filters(body, state["df"])
+
+        if not movies:
+            return {"results": []}
+
+        _, _, titles = await asyncio.to_thread(
+            hybrid_recommend_many, movies, state["df"], state["similarity_index"], state["rules"], top_n, **filters
+        )
+        found = get_title_index(state["df"]).rows_of(movies) >= 0
+
+        return {"results": [
+            {
+                "movie": movie,
+                # Unknown titles get null rather than an empty list
+                "recommendations": [title for title in row if title is not None] if is_found else None,
+            }
+            for movie, is_found, row in zip(movies, found, titles.tolist())
+        ]}
+
+    async def recommend_profile(receive):
+        body = await _read_json(receive)
+        movies = _titles(body, "movies")
+        exclude = _titles(body, "exclude") if "exclude" in body else None
+        weights = body.get("weights")
+        top_n = _top_n(body, default=10)
+        filters = _filters(body, state["df"])
+
+        if weights is not None and (
+            not isinstance(weights, list) or len(weights) != len(movies)
+            or not all(isinstance(w, (int, float)) and not isinstance(w, bool) and w >= 0 for w in weights)
+        ):
+            raise HTTPError(400, "'weights' must be one non-negative number per movie")
+
+        _, scores, titles = await asyncio.to_thread(
+            profile_recommend, movies, state["df"], state["similarity_index"], state["rules"],
+            weights=weights, top_n=top_n, exclude=exclude, **filters
+        )
+
+        return {"recommendations": [
+            {"movie": title, "score": float(score)} for title, score in zip(titles.tolist(), scores.tolist())
+        ]}
+
+    async def agent(receive):
+        body = await _read_json(receive)
+        message = _field(body, "message", str)
+        return {"reply": await state["agent"](message)}
+
+    routes = {
+        "/health": ("GET", health),
+        "/metrics": ("GET", prometheus),
+        "/recommend": ("POST", recommend),
+        "/recommend/batch": ("POST", recommend_batch),
+        "/recommend/profile": ("POST", recommend_profile),
+        "/agent": ("POST", agent),
+    }
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            await _lifespan(receive, send, startup)
+            return
+
+        if scope["type"] != "http":
+            return
+
+        path = scope["path"]
+        route = routes.get(path)
+
+        with metrics.timer("http_request_seconds", path=path if route else "other"):
+            try:
+                if route is None:
+                    raise HTTPError(404, f"No such endpoint: {path}")
+
+                method, handler = route
+                if scope["method"] != method:
+                    raise HTTPError(405, f"Use {method} for {path}")
+
+                status, payload = 200, await asyncio.wait_for(handler(receive), request_timeout)
+            except HTTPError as e:
+                status, payload = e.status, {"error": str(e)}
+            except asyncio.TimeoutError:
+                status, payload = 504, {"error": f"Request took longer than {request_timeout}s"}
+
+            await _respond(send, status, payload)
+
+        metrics.inc("http_requests_total", path=path if route else "other", status=status)
+
+    return app
+
+
+def app_from_env():
+    """
+    create_app configured from MOVIE_RECOMMENDER_* environment variables,
+    for process managers that import the app by name in each worker
+    """
+    return create_app(
+        artifact_dir=os.environ.get("MOVIE_RECOMMENDER_ARTIFACT_DIR") or None,
+        data_dir=os.environ.get("MOVIE_RECOMMENDER_DATA_DIR") or None,
+        model=os.environ.get("MOVIE_RECOMMENDER_MODEL", "llama3.2"),
+        request_timeout=float(os.environ.get("MOVIE_RECOMMENDER_REQUEST_TIMEOUT", 10.0)),
+        agent_timeout=float(os.environ.get("MOVIE_RECOMMENDER_AGENT_TIMEOUT", 8.0)),
+    )
+
+
+async def _lifespan(receive, send, startup):
+    while True:
+        message = await receive()
+
+        if message["type"] == "lifespan.startup":
+            try:
+                startup()
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def _read_json(receive):
+    chunks = []
+    size = 0
+
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise HTTPError(400, "Client disconnected")
+
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise HTTPError(413, f"Body larger than {MAX_BODY_BYTES} bytes")
+        chunks.append(chunk)
+
+        if not message.get("more_body", False):
+            break
+
+    try:
+        body = json.loads(b"".join(chunks))
+    except ValueError:
+        raise HTTPError(400, "Body is not valid JSON")
+
+    if not isinstance(body, dict):
+        raise HTTPError(400, "Body must be a JSON object")
+
+    return body
+
+
+def _field(body, name, kind):
+    value = body.get(name)
+    if not isinstance(value, kind):
+        raise HTTPError(400, f"'{name}' must be a {kind.__name__}")
+    return value
+
+
+def _filters(body, df):
+    filters = {}
+
+    genre = body.get("genre")
+    if genre is not None:
+        if not isinstance(genre, str) or genre not in get_catalog_index(df).genre_names():
+            raise HTTPError(400, f"Unknown genre: {genre}")
+        filters["genre"] = genre
+
+    for name in ("min_rating", "min_popularity"):
+        value = body.get(name)
+        if value is not None:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise HTTPError(400, f"'{name}' must be a number")
+            filters[name] = float(value)
+
+    return filters
+
+
+def _titles(body, name):
+    titles = _field(body, name, list)
+    if len(titles) > MAX_BATCH:
+        raise HTTPError(400, f"At most {MAX_BATCH} entries in '{name}'")
+    if not all(isinstance(title, str) for title in titles):
+        raise HTTPError(400, f"'{name}' must be a list of titles")
+    return titles
+
+
+def _top_n(body, default=4):
+    top_n = body.get("top_n", default)
+    if isinstance(top_n, bool) or not isinstance(top_n, int) or not 1 <= top_n <= MAX_TOP_N:
+        raise HTTPError(400, f"'top_n' must be an integer from 1 to {MAX_TOP_N}")
+    return top_n
+
+
+async def _respond(send, status, payload):
+    if isinstance(payload, str):
+        body, content_type = payload.encode(), b"text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload, ensure_ascii=False).encode(), b"application/json"
+
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--keep-alive", type=int, default=5, help="Idle seconds before a connection is closed")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds per request before a 504")
+    parser.add_argument("--agent-timeout", type=float, default=8.0, help="Seconds before the agent skips the LLM")
+    parser.add_argument("--model", default="llama3.2")
+    parser.add_argument("--artifact-dir", default=None)
+    parser.add_argument("--data-dir", default=None)
+    parser.add_argument("--app", default="server:app_from_env", help="App factory each worker imports")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    # Build here, once, so the workers only ever map a finished build
+    ensure_artifacts(args.artifact_dir, args.data_dir, n_jobs=-1)
+
+    os.environ.update({
+        "MOVIE_RECOMMENDER_ARTIFACT_DIR": args.artifact_dir or "",
+        "MOVIE_RECOMMENDER_DATA_DIR": args.data_dir or "",
+        "MOVIE_RECOMMENDER_MODEL": args.model,
+        "MOVIE_RECOMMENDER_REQUEST_TIMEOUT": str(args.timeout),
+        "MOVIE_RECOMMENDER_AGENT_TIMEOUT": str(args.agent_timeout),
+    })
+
+    uvicorn.run(
+        args.app, factory=True, host=args.host, port=args.port, workers=args.workers,
+        timeout_keep_alive=args.keep_alive, lifespan="on"
+    )
+
+
+if __name__ == "__main__":
+    main()
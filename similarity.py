@@ -1,12 +1,239 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfTransformer
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+import numpy as np
+from ml.features import get_feature_store
+from ml.preprocessing import get_derived
 
 
-def build_similarity_matrix(df):
-    vectorizer = TfidfVectorizer(stop_words="english")
+# Per-process state for neighbor-build workers: (tfidf_matrix, tfidf_t, neighbors, scores, top_k)
+_worker_state = None
+
+
+class NeighborIndex:
+    """
+    Top-K most similar movies per row, kept as compact int32/float32 arrays
+    instead of the dense N x N similarity matrix
+    """
+
+    def __init__(self, neighbors, scores):
+        # Both arrays are (N, K); each row is sorted by descending score
+        self.neighbors = neighbors
+        self.scores = scores
+
+    def __len__(self):
+        return self.neighbors.shape[0]
+
+    @property
+    def top_k(self):
+        return self.neighbors.shape[1]
+
+    def neighbors_of(self, idx, k=None):
+        """
+        Return the k most similar movies to row idx as (row, score) pairs
+        """
+        k = self.top_k if k is None else min(k, self.top_k)
+        return list(zip(self.neighbors[idx, :k].tolist(), self.scores[idx, :k].tolist()))
+
+
+class EmbeddingIndex:
+    """
+    Low-rank (LSA) movie embeddings: one contiguous float32 row of
+    L2-normalized components per movie
+
+    Indexing it like the dense similarity matrix computes those rows on
+    demand, so embedding_index[rows] is one BLAS product of the query rows
+    against every movie; hybrid_recommend runs on it unchanged.
+
+    Its similarities only approximate the TF-IDF cosine, so this trades
+    accuracy for a small, dense index: the candidates it picks can differ
+    from the exact ones, increasingly so as the catalog grows (see
+    embedding_recall in benchmarks/suite.py).
+    """
+
+    def __init__(self, embeddings):
+        # (N, D), C-contiguous so a memory-mapped file feeds BLAS directly
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    @property
+    def shape(self):
+        return (len(self), len(self))
 
-    tfidf_matrix = vectorizer.fit_transform(df["combined"])
+    @property
+    def dim(self):
+        return self.embeddings.shape[1]
+
+    def __getitem__(self, rows):
+        return self.embeddings[rows] @ self.embeddings.T
+
+    def similarity_to(self, vectors):
+        """
+        Cosine similarity of (already normalized) embedding vectors to every movie
+        """
+        return np.asarray(vectors, dtype=np.float32) @ self.embeddings.T
+
+
+def build_tfidf_matrix(df):
+    # TF-IDF over whole genre/cast entities rather than words of a joined text column
+    transformer = TfidfTransformer()
+
+    return transformer.fit_transform(get_feature_store(df).matrix())
+
+
+def get_tfidf_matrix(df):
+    """
+    The TF-IDF matrix for df, built on first use and reused afterwards
+    """
+    return get_derived(df, "tfidf", build_tfidf_matrix)
+
+
+def idf_weights(document_frequency, n_movies):
+    """
+    Smoothed IDF per entity, the same weights TfidfTransformer() fits
+    """
+    return np.log((1 + n_movies) / (1 + np.asarray(document_frequency, dtype=np.float64))) + 1
+
+
+def tfidf_vectors(matrix, idf):
+    """
+    L2-normalized TF-IDF rows of a binary movies x entities matrix under
+    fixed IDF weights, matching build_tfidf_matrix when idf is fitted on it
+    """
+    return normalize(matrix.multiply(idf.astype(matrix.dtype)).tocsr())
+
+
+def build_similarity_matrix(df):
+    tfidf_matrix = build_tfidf_matrix(df)
 
     similarity_matrix = cosine_similarity(tfidf_matrix)
 
-    return similarity_matrix
\ No newline at end of file
+    return similarity_matrix
+
+
+def build_neighbor_index(df, top_k=50, block_size=256, n_jobs=1, out_dir=None):
+    """
+    Build a top-K neighbor index from the sparse TF-IDF matrix
+
+    Similarities are computed one block of rows at a time, so peak memory
+    is block_size x N floats rather than N x N. With n_jobs > 1 the blocks
+    are spread over a process pool (n_jobs=-1 uses every core), each worker
+    writing its rows straight into memory-mapped output arrays.
+
+    With out_dir, the arrays are kept there as neighbors.npy / scores.npy
+    and the returned index maps them; otherwise they end up in memory.
+    """
+    tfidf_matrix = build_tfidf_matrix(df)
+
+    n_movies = tfidf_matrix.shape[0]
+    top_k = max(0, min(top_k, n_movies - 1))
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = max(1, n_jobs)
+
+    if n_jobs == 1 and out_dir is None:
+        neighbors = np.empty((n_movies, top_k), dtype=np.int32)
+        scores = np.empty((n_movies, top_k), dtype=np.float32)
+
+        if top_k == 0:
+            return NeighborIndex(neighbors, scores)
+
+        # TF-IDF rows are L2-normalized, so the dot product is the cosine similarity
+        tfidf_t = tfidf_matrix.T.tocsr()
+
+        for start in range(0, n_movies, block_size):
+            end = min(start + block_size, n_movies)
+            neighbors[start:end], scores[start:end] = top_neighbors(tfidf_matrix, tfidf_t, np.arange(start, end), top_k)
+
+        return NeighborIndex(neighbors, scores)
+
+    tmp_dir = None
+    if out_dir is None:
+        out_dir = tmp_dir = tempfile.mkdtemp(prefix='neighbors-')
+    os.makedirs(out_dir, exist_ok=True)
+
+    neighbors_path = os.path.join(out_dir, 'neighbors.npy')
+    scores_path = os.path.join(out_dir, 'scores.npy')
+    np.lib.format.open_memmap(neighbors_path, mode='w+', dtype=np.int32, shape=(n_movies, top_k)).flush()
+    np.lib.format.open_memmap(scores_path, mode='w+', dtype=np.float32, shape=(n_movies, top_k)).flush()
+
+    try:
+        if top_k > 0:
+            starts = list(range(0, n_movies, block_size))
+            ends = [min(start + block_size, n_movies) for start in starts]
+
+            with ProcessPoolExecutor(
+                n_jobs, initializer=_init_worker,
+                initargs=(tfidf_matrix, neighbors_path, scores_path, top_k)
+            ) as pool:
+                # Consume the results so worker errors surface here
+                list(pool.map(_build_block, starts, ends, chunksize=max(1, len(starts) // (4 * n_jobs))))
+
+        if tmp_dir is not None:
+            return NeighborIndex(np.load(neighbors_path), np.load(scores_path))
+        return NeighborIndex(np.load(neighbors_path, mmap_mode='r'), np.load(scores_path, mmap_mode='r'))
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _init_worker(tfidf_matrix, neighbors_path, scores_path, top_k):
+    global _worker_state
+    _worker_state = (
+        tfidf_matrix,
+        tfidf_matrix.T.tocsr(),
+        np.load(neighbors_path, mmap_mode='r+'),
+        np.load(scores_path, mmap_mode='r+'),
+        top_k
+    )
+
+
+def _build_block(start, end):
+    """
+    Write the top-K neighbors of rows start:end into the output arrays
+    """
+    tfidf_matrix, tfidf_t, neighbors, scores, top_k = _worker_state
+    neighbors[start:end], scores[start:end] = top_neighbors(tfidf_matrix, tfidf_t, np.arange(start, end), top_k)
+
+
+def top_neighbors(tfidf_matrix, tfidf_t, rows, top_k):
+    """
+    Top-K (neighbors, scores) of the given rows against every movie,
+    excluding each row itself; tfidf_t is tfidf_matrix.T as CSR
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    positions = np.arange(len(rows))
+
+    block = (tfidf_matrix[rows] @ tfidf_t).toarray().astype(np.float32)
+
+    # A movie is never its own neighbor
+    block[positions, rows] = -np.inf
+
+    top = np.argpartition(-block, top_k - 1, axis=1)[:, :top_k]
+    top_scores = np.take_along_axis(block, top, axis=1)
+
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def build_embedding_index(df, dim=128, seed=0):
+    """
+    Project the TF-IDF rows onto their top dim singular vectors (LSA) and
+    L2-normalize, so a dot product is again a cosine similarity, of the
+    projections rather than of the exact TF-IDF rows
+    """
+    tfidf_matrix = build_tfidf_matrix(df)
+    dim = max(1, min(dim, tfidf_matrix.shape[1] - 1, tfidf_matrix.shape[0] - 1))
+
+    embeddings = TruncatedSVD(n_components=dim, random_state=seed).fit_transform(tfidf_matrix)
+
+    return EmbeddingIndex(np.ascontiguousarray(normalize(embeddings), dtype=np.float32))
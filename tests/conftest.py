@@ -0,0 +1,14 @@
+import pytest
+
+from ml.preprocessing import load_and_clean_data
+from benchmarks.synthetic import write_catalog
+
+
+@pytest.fixture(scope="session")
+def catalog(tmp_path_factory):
+    """
+    A cleaned 3,000-title synthetic catalog, shared by every test
+    """
+    data_dir = tmp_path_factory.mktemp("data")
+    write_catalog(str(data_dir), 3000, seed=0)
+    return load_and_clean_data(str(data_dir))
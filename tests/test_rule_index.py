@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from ml.association import build_association_rules, build_rule_index
+from ml.similarity import build_neighbor_index
+from ml.recommender import hybrid_recommend, hybrid_recommend_many, CANDIDATES, _scan_rule_boosts
+
+
+@pytest.fixture(scope="module")
+def model(catalog):
+    rules = build_association_rules(catalog, min_support=0.005, min_confidence=0.1)
+    assert len(rules) > 0
+    return build_neighbor_index(catalog), rules, build_rule_index(rules, catalog)
+
+
+def test_boosts_match_rules_frame(catalog, model):
+    similarity_index, rules, rule_index = model
+
+    for idx in range(0, len(catalog), 30):
+        candidates = similarity_index.neighbors[idx, :CANDIDATES]
+
+        expected = _scan_rule_boosts(idx, candidates, catalog, rules)
+        boosts = rule_index.candidate_boosts(rule_index.boost_vector(idx), candidates)
+
+        np.testing.assert_allclose(boosts, expected)
+
+
+def test_recommendations_match_rules_frame(catalog, model):
+    similarity_index, rules, rule_index = model
+    titles = catalog["title"].sample(100, random_state=0).tolist()
+
+    for title in titles:
+        assert hybrid_recommend(title, catalog, similarity_index, rule_index) == \
+            hybrid_recommend(title, catalog, similarity_index, rules)
+
+    indices, scores, _ = hybrid_recommend_many(titles, catalog, similarity_index, rule_index)
+    frame_indices, frame_scores, _ = hybrid_recommend_many(titles, catalog, similarity_index, rules)
+
+    np.testing.assert_array_equal(indices, frame_indices)
+    np.testing.assert_allclose(scores, frame_scores)
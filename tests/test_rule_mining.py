@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+from mlxtend.frequent_patterns import apriori, association_rules
+from mlxtend.preprocessing import TransactionEncoder
+
+from ml.association import build_association_rules
+from ml.features import get_feature_store
+
+
+def mlxtend_rules(df, min_support, min_confidence, max_len):
+    """
+    The reference path: dense one-hot transactions through apriori and
+    association_rules, over the same kind-qualified entities
+    """
+    features = get_feature_store(df)
+    transactions = [[features.labels[i] for i in features.entities_of(row)] for row in range(len(features))]
+
+    encoder = TransactionEncoder()
+    encoded = pd.DataFrame(encoder.fit(transactions).transform(transactions), columns=encoder.columns_)
+
+    frequent_itemsets = apriori(encoded, min_support=min_support, use_colnames=True, max_len=max_len)
+    if len(frequent_itemsets) == 0:
+        return pd.DataFrame(columns=["antecedents", "consequents", "confidence"])
+    return association_rules(frequent_itemsets, metric="confidence", min_threshold=min_confidence)
+
+
+def rule_table(rules):
+    return {
+        (antecedent, consequent): confidence
+        for antecedent, consequent, confidence in zip(rules["antecedents"], rules["consequents"], rules["confidence"])
+    }
+
+
+@pytest.mark.parametrize("min_support, min_confidence, max_len", [
+    (0.02, 0.3, None),
+    (0.01, 0.2, None),
+    (0.005, 0.1, None),
+    (0.005, 0.1, 2),
+])
+def test_rules_match_mlxtend(catalog, min_support, min_confidence, max_len):
+    ours = rule_table(build_association_rules(
+        catalog, min_support=min_support, min_confidence=min_confidence, max_len=max_len
+    ))
+    reference = rule_table(mlxtend_rules(catalog, min_support, min_confidence, max_len))
+
+    assert ours.keys() == reference.keys()
+    for rule, confidence in reference.items():
+        assert ours[rule] == pytest.approx(confidence)
+
+
+def test_parallel_mining_matches_serial(catalog):
+    serial = build_association_rules(catalog, min_support=0.005, min_confidence=0.1)
+    parallel = build_association_rules(catalog, min_support=0.005, min_confidence=0.1, n_jobs=2)
+
+    pd.testing.assert_frame_equal(serial, parallel)
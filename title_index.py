@@ -0,0 +1,277 @@
+import bisect
+import re
+
+import numpy as np
+
+from ml.preprocessing import get_derived
+
+
+def normalize_title(title):
+    """
+    Lowercase and collapse whitespace, so 'The  Dark Knight ' == 'the dark knight'
+    """
+    return re.sub(r"\s+", " ", str(title)).strip().casefold()
+
+
+class TitleIndex:
+    """
+    Constant-time title -> positional row lookup
+    """
+
+    def __init__(self, titles):
+        self.titles = list(titles)
+        self.rows = {}
+        self.normalized = {}
+
+        # The same titles as an object array, to index by arrays of rows
+        self.title_array = np.array(self.titles, dtype=object)
+
+        # First occurrence wins, matching the order rows were loaded in
+        for row, title in enumerate(self.titles):
+            self.rows.setdefault(title, row)
+            self.normalized.setdefault(normalize_title(title), row)
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __contains__(self, title):
+        return self.get(title) is not None
+
+    def get(self, title, default=None):
+        """
+        Row of an exact title, falling back to its normalized form
+        """
+        row = self.rows.get(title)
+        if row is None:
+            row = self.normalized.get(normalize_title(title), default)
+        return row
+
+    def rows_of(self, titles):
+        """
+        Rows for many titles at once, -1 where a title is unknown
+        """
+        return np.fromiter((self.get(title, -1) for title in titles), dtype=np.int64, count=len(titles))
+
+
+def build_title_index(df):
+    return TitleIndex(df["title"])
+
+
+def get_title_index(df):
+    """
+    The title index for df, built on first use and reused afterwards
+    """
+    return get_derived(df, "title_index", build_title_index)
+
+
+def search_key(title):
+    """
+    Looser normalization for fuzzy matching: drops punctuation and a
+    trailing release year, so 'Inception (2010)' -> 'inception'
+    """
+    key = normalize_title(title)
+    key = re.sub(r"\s*\(\d{4}\)$", "", key)
+    key = re.sub(r"[^\w\s]", " ", key)
+    return re.sub(r"\s+", " ", key).strip()
+
+
+# Words that introduce the movie a request is about: 'something like Heat'
+CUES = [cue.split() for cue in ("like", "similar to", "such as", "as good as", "in the vein of")]
+
+QUOTED = re.compile(r'["\u201c]([^"\u201d]+)["\u201d]')
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleResolver:
+    """
+    Fuzzy and prefix title matching over a precomputed character-trigram index
+
+    Everything derived from the titles is kept as arrays (ARRAYS), so a
+    build can be saved and memory-mapped: keys[row] is the search key of
+    titles[row], prefix_order the rows sorted by key, and trigram t
+    (trigrams[t]) occurs in the keys of rows
+    posting_rows[posting_indptr[t]:posting_indptr[t + 1]].
+    """
+
+    ARRAYS = ("keys", "prefix_order", "trigrams", "trigram_counts", "posting_indptr", "posting_rows")
+
+    def __init__(self, titles, keys, prefix_order, trigrams, trigram_counts, posting_indptr, posting_rows):
+        self.titles = list(titles)
+        self.keys = keys
+        self.prefix_order = prefix_order
+        self.trigrams = trigrams
+        self.trigram_counts = trigram_counts
+        self.posting_indptr = posting_indptr
+        self.posting_rows = posting_rows
+
+        key_list = keys.tolist()
+        self.exact = {}
+        for row, key in enumerate(key_list):
+            self.exact.setdefault(key, row)
+
+        self.max_words = int(np.char.count(keys, " ").max()) + 1 if len(keys) else 0
+
+        # Sorted keys for prefix lookups
+        self.sorted_keys = [key_list[row] for row in prefix_order.tolist()]
+        self.trigram_ids = {gram: i for i, gram in enumerate(trigrams.tolist())}
+
+    def match(self, query, limit=5, min_score=0.4):
+        """
+        Rank titles by trigram similarity to query
+
+        Returns up to limit (title, score) pairs with score in [0, 1];
+        an exact match on the normalized title scores 1.0.
+        """
+        key = search_key(query)
+        if not key:
+            return []
+
+        query_grams = _trigrams(key)
+        grams = [self.trigram_ids[gram] for gram in query_grams if gram in self.trigram_ids]
+
+        results = {}
+
+        row = self.exact.get(key)
+        if row is not None:
+            results[row] = 1.0
+
+        if grams:
+            hits = np.concatenate([
+                self.posting_rows[self.posting_indptr[g]:self.posting_indptr[g + 1]] for g in grams
+            ])
+            shared = np.bincount(hits, minlength=len(self.keys))
+            candidates = np.flatnonzero(shared)
+
+            # Dice coefficient between the two trigram sets
+            scores = 2.0 * shared[candidates] / (len(query_grams) + self.trigram_counts[candidates])
+
+            k = min(limit, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            for i in top:
+                if scores[i] >= min_score:
+                    results.setdefault(int(candidates[i]), float(scores[i]))
+
+        ranked = sorted(results.items(), key=lambda x: (-x[1], x[0]))[:limit]
+        return [(self.titles[row], score) for row, score in ranked]
+
+    def best_match(self, query, min_score=0.6):
+        """
+        The single most likely title for query, or None
+        """
+        matches = self.match(query, limit=1, min_score=min_score)
+        return matches[0][0] if matches else None
+
+    def find_in_text(self, text):
+        """
+        The catalog title text names, or None when that is not clear-cut
+
+        A title counts when it is quoted, capitalized past the first word,
+        or several words long right after a cue ('like the dark knight');
+        matches that read as ordinary words ('i have taken a liking', 'date
+        night') only count when they are the whole text. The quoted title
+        wins, then the one after a cue, then the only one named at all;
+        anything ambiguous returns None so the caller can ask the LLM.
+        """
+        raw_words = re.sub(r"[^\w\s]", " ", str(text)).split()
+        words = [word.casefold() for word in raw_words]
+
+        quoted = {
+            self.exact[key] for key in map(search_key, QUOTED.findall(str(text))) if key in self.exact
+        }
+        if len(quoted) == 1:
+            return self.titles[quoted.pop()]
+
+        # Every title n-gram not inside a longer one
+        spans = []
+        for n in range(min(self.max_words, len(words)), 0, -1):
+            for start in range(len(words) - n + 1):
+                row = self.exact.get(" ".join(words[start:start + n]))
+                if row is not None and not any(s <= start and start + n <= e for s, e, _ in spans):
+                    spans.append((start, start + n, row))
+
+        if len(spans) == 1 and spans[0][:2] == (0, len(words)):
+            return self.titles[spans[0][2]]
+
+        cued, named, mentioned = set(), set(), set()
+        for start, end, row in spans:
+            is_cued = any(words[max(0, start - len(cue)):start] == cue for cue in CUES)
+            capitals = [raw_words[i][:1].isupper() for i in range(start, end)]
+
+            # A capital on the first word of the text says nothing, and one
+            # lowercase word is most likely just a word, cue or not ('i'd like action')
+            if any(capitals[1:] if start == 0 else capitals) or is_cued and end - start > 1:
+                named.add(row)
+                if is_cued:
+                    cued.add(row)
+            if any(capitals):
+                mentioned.add(row)
+
+        if len(cued) == 1:
+            return self.titles[cued.pop()]
+        if len(named) == 1 and len(named | mentioned) == 1:
+            return self.titles[named.pop()]
+
+        return None
+
+    def complete(self, prefix, limit=10):
+        """
+        Titles starting with prefix, topped up with fuzzy matches
+        """
+        key = search_key(prefix)
+        if not key:
+            return []
+
+        start = bisect.bisect_left(self.sorted_keys, key)
+        end = bisect.bisect_left(self.sorted_keys, key + "\uffff", lo=start)
+
+        rows = self.prefix_order[start:min(end, start + limit)].tolist()
+        titles = [self.titles[row] for row in rows]
+
+        if len(titles) < limit:
+            for title, _ in self.match(prefix, limit=limit):
+                if title not in titles:
+                    titles.append(title)
+
+        return titles[:limit]
+
+
+def build_title_resolver(df):
+    """
+    Search keys and the trigram postings of df's titles
+    """
+    titles = df["title"].tolist()
+    keys = [search_key(title) for title in titles]
+
+    postings = {}
+    trigram_counts = np.zeros(len(keys), dtype=np.int32)
+    for row, key in enumerate(keys):
+        grams = _trigrams(key)
+        trigram_counts[row] = len(grams)
+        for gram in grams:
+            postings.setdefault(gram, []).append(row)
+
+    posting_indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+    posting_indptr[1:] = np.cumsum([len(rows) for rows in postings.values()])
+
+    return TitleResolver(
+        titles,
+        keys=np.array(keys, dtype=str),
+        prefix_order=np.array(sorted(range(len(keys)), key=keys.__getitem__), dtype=np.int64),
+        trigrams=np.array(list(postings), dtype=str),
+        trigram_counts=trigram_counts,
+        posting_indptr=posting_indptr,
+        posting_rows=np.fromiter(
+            (row for rows in postings.values() for row in rows), dtype=np.int32, count=posting_indptr[-1]
+        ),
+    )
+
+
+def get_title_resolver(df):
+    """
+    The fuzzy title resolver for df, built on first use and reused afterwards
+    """
+    return get_derived(df, "title_resolver", build_title_resolver)